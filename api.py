@@ -0,0 +1,217 @@
+import json
+import base64
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from db import init_db, reader, table_version, COLUMNS
+
+# Read-only JSON API over the category views, meant to run next to the
+# Streamlit app:
+#
+#   GET /v1/tables
+#   GET /v1/<table>?brand=&year_min=&year_max=&price_min=&price_max=
+#                  &scraped_from=&scraped_to=&fields=&limit=&cursor=
+#   GET /v1/<table>/aggregate?group_by=brand|year|fuel_type|gearbox&<filters>
+#
+# Every response carries an ETag derived from the table version and the
+# request, and bodies are kept in an in-process LRU keyed the same way, so
+# a client polling with If-None-Match gets a 304 without touching SQLite
+# beyond the version lookup.
+CACHE_SIZE = 256
+MAX_LIMIT = 1000
+GROUP_BY = ('brand', 'year', 'fuel_type', 'gearbox', 'adress')
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class LRUCache:
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.items:
+                return None
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+
+_cache = LRUCache(CACHE_SIZE)
+
+
+def view_columns(table):
+    return ['id'] + COLUMNS[table] + ['price', 'cluster_id', 'scraped_date']
+
+def _one(params, name, cast=str):
+    values = params.get(name)
+    if not values or values[0] == '':
+        return None
+    try:
+        return cast(values[0])
+    except ValueError:
+        raise ApiError(400, f"invalid value for {name}: {values[0]!r}")
+
+def filters(params):
+    # Returns (where clause, args) for the filter parameters
+    where, args = [], []
+    brands = [b for v in params.get('brand', []) for b in v.split(',') if b]
+    if brands:
+        where.append(f"brand COLLATE NOCASE IN ({', '.join('?' * len(brands))})")
+        args += brands
+    for name, sql in (('year_min', "CAST(year AS INTEGER) >= ?"), ('year_max', "CAST(year AS INTEGER) <= ?"),
+                      ('price_min', "price >= ?"), ('price_max', "price <= ?")):
+        value = _one(params, name, int)
+        if value is not None:
+            where.append(sql)
+            args.append(value)
+    for name, sql in (('scraped_from', "scraped_date >= ?"), ('scraped_to', "scraped_date <= ?")):
+        value = _one(params, name)
+        if value is not None:
+            # A bare date as the upper bound covers the whole day
+            where.append(sql)
+            args.append(value + " 23:59:59" if name == 'scraped_to' and len(value) == 10 else value)
+    return where, args
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except ValueError:
+        raise ApiError(400, "invalid cursor")
+
+def list_rows(table, params):
+    columns = view_columns(table)
+    fields = [f for v in params.get('fields', []) for f in v.split(',') if f] or columns
+    unknown = sorted(set(fields) - set(columns))
+    if unknown:
+        raise ApiError(400, f"unknown fields: {', '.join(unknown)}")
+
+    limit = _one(params, 'limit', int)
+    if limit is not None and limit < 1:
+        raise ApiError(400, f"limit must be between 1 and {MAX_LIMIT}")
+    limit = min(limit or 100, MAX_LIMIT)
+    where, args = filters(params)
+    cursor = _one(params, 'cursor')
+    if cursor:
+        where.append("id > ?")
+        args.append(decode_cursor(cursor))
+
+    # id is always read for the cursor, even when not projected
+    select = ", ".join(dict.fromkeys(['id'] + fields))
+    sql = f"SELECT {select} FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id LIMIT ?"
+    with reader() as conn:
+        c = conn.execute(sql, args + [limit + 1])
+        names = [d[0] for d in c.description]
+        rows = [dict(zip(names, r)) for r in c.fetchall()]
+
+    next_cursor = encode_cursor(rows[limit - 1]['id']) if len(rows) > limit else None
+    data = [{f: row[f] for f in fields} for row in rows[:limit]]
+    return {'data': data, 'next_cursor': next_cursor}
+
+def aggregate(table, params):
+    group_by = _one(params, 'group_by') or 'brand'
+    if group_by not in GROUP_BY or group_by not in view_columns(table):
+        raise ApiError(400, f"cannot group {table} by {group_by}")
+
+    where, args = filters(params)
+    sql = f'''SELECT {group_by} AS key, COUNT(*) AS count, COUNT(DISTINCT cluster_id) AS vehicles,
+                     AVG(price) AS avg_price, MIN(price) AS min_price, MAX(price) AS max_price
+              FROM {table}'''
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" GROUP BY {group_by} ORDER BY count DESC"
+    with reader() as conn:
+        c = conn.execute(sql, args)
+        names = [d[0] for d in c.description]
+        return {'group_by': group_by, 'data': [dict(zip(names, r)) for r in c.fetchall()]}
+
+def route(path, params):
+    # Returns (table or None, handler)
+    parts = [p for p in path.split('/') if p]
+    if parts == ['v1', 'tables']:
+        return None, lambda: {'tables': [{'name': t, 'columns': view_columns(t), 'version': table_version(t)}
+                                         for t in COLUMNS]}
+    if len(parts) in (2, 3) and parts[0] == 'v1' and parts[1] in COLUMNS:
+        table = parts[1]
+        if len(parts) == 2:
+            return table, lambda: list_rows(table, params)
+        if parts[2] == 'aggregate':
+            return table, lambda: aggregate(table, params)
+    raise ApiError(404, f"no such endpoint: {path}")
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "DakaAutoAPI/1.0"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            params = parse_qs(url.query)
+            table, handler = route(url.path, params)
+            versions = [table_version(t) for t in ([table] if table else COLUMNS)]
+            key = (url.path, url.query, tuple(versions))
+            etag = '"' + hashlib.sha1(repr(key).encode()).hexdigest()[:20] + '"'
+
+            if etag in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+                self._send(304, None, etag)
+                return
+            body = _cache.get(key)
+            if body is None:
+                body = json.dumps(handler(), ensure_ascii=False).encode('utf-8')
+                _cache.put(key, body)
+            self._send(200, body, etag)
+        except ApiError as e:
+            self._send(e.status, json.dumps({'error': str(e)}).encode('utf-8'))
+        except Exception as e:
+            # Anything else (e.g. a locked or corrupt database) still gets
+            # a JSON body rather than a dropped connection
+            self.log_error("%s: %s: %s", self.path, type(e).__name__, e)
+            self._send(500, json.dumps({'error': f"internal error: {type(e).__name__}"}).encode('utf-8'))
+
+    def _send(self, status, body, etag=None):
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        if body is not None:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+
+def serve(host='127.0.0.1', port=8502):
+    init_db()
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"Serving on http://{host}:{port}/v1/tables")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Read-only JSON API over the scraped data")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    args = parser.parse_args()
+    serve(args.host, args.port)
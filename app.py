@@ -1,11 +1,18 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
-from requests import get
-from bs4 import BeautifulSoup as bs
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
+from scraper import scrape, find_resumable
+from db import (init_db, load_typed, clear_table, price_history, write_metrics, summarize,
+                price_quantiles, sketch_keys, add_fair_price, load_changes, change_counts, table_version,
+                COLUMNS)
+from sketches import ANY
+from changes import to_jsonl, KINDS
+from archive import load_history
+from charts import summarize_frame, price_figure
+from facets import FacetIndex, view_for
+from scoring import load_scores
 
 # Page configuration
 st.set_page_config(
@@ -61,187 +68,61 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Database functions
-def init_db():
-    conn = sqlite3.connect('daka_auto.db')
-    c = conn.cursor()
-    
-    # Table for cars
-    c.execute('''CREATE TABLE IF NOT EXISTS voitures
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  brand TEXT, model TEXT, year TEXT, kilometer TEXT,
-                  fuel_type TEXT, gearbox TEXT, adress TEXT,
-                  owner TEXT, price TEXT, scraped_date TEXT)''')
-    
-    # Table for motos
-    c.execute('''CREATE TABLE IF NOT EXISTS motos
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  brand TEXT, year TEXT, kilometer TEXT,
-                  adress TEXT, owner TEXT, price TEXT, scraped_date TEXT)''')
-    
-    # Table for car rental
-    c.execute('''CREATE TABLE IF NOT EXISTS location
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  brand TEXT, year TEXT, adress TEXT,
-                  owner TEXT, price TEXT, scraped_date TEXT)''')
-    
-    conn.commit()
-    conn.close()
-
-def save_to_db(df, table_name):
-    df['scraped_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    conn = sqlite3.connect('daka_auto.db')
-    df.to_sql(table_name, conn, if_exists='append', index=False)
-    conn.close()
-
-def load_from_db(table_name):
-    conn = sqlite3.connect('daka_auto.db')
-    df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-    conn.close()
-    return df
-
-# Scraping functions
-def scrape_voitures(num_pages):
-    df = pd.DataFrame()
+# Scraping
+def scrape_with_progress(category, num_pages, crawl_id=None):
     progress_bar = st.progress(0)
     status_text = st.empty()
-    
-    for index in range(1, num_pages + 1):
-        status_text.text(f'Scraping page {index}/{num_pages}...')
-        progress_bar.progress(index / num_pages)
-        
-        url = f'https://dakar-auto.com/senegal/voitures-4?&page={index}'
-        res = get(url)
-        soup = bs(res.content, 'html.parser')
-        containers = soup.find_all('div', class_='listings-cards__list-item mb-md-3 mb-3')
-        
-        data = []
-        for container in containers:
-            try:
-                gen_inf = container.find('h2', class_='listing-card__header__title mb-md-2 mb-0').a.text.strip().split()
-                brand = gen_inf[0]
-                model = " ".join(gen_inf[1:len(gen_inf)-1])
-                year = gen_inf[-1]
-                
-                gen_inf1 = container.find('ul', 'listing-card__attribute-list list-inline mb-0')
-                gen_inf2 = gen_inf1.find_all('li', 'listing-card__attribute list-inline-item')
-                kms_driven = gen_inf2[1].text.replace('km','')
-                gearbox = gen_inf2[2].text
-                fuel_type = gen_inf2[3].text
-                
-                adress = container.find('div',class_='col-12 entry-zone-address').text
-                owner = "".join(container.find('p', class_='time-author m-0').a.text).replace('Par','')
-                price = "".join(container.find('h3','listing-card__header__price font-weight-bold text-uppercase mb-0').text.strip().split()).replace('FCFA','')
-                
-                dic = {
-                    "brand": brand, "model": model, "year": year,
-                    "kilometer": kms_driven, "fuel_type": fuel_type,
-                    "gearbox": gearbox, "adress": adress,
-                    "owner": owner, "price": price
-                }
-                data.append(dic)
-            except:
-                pass
-        
-        DF = pd.DataFrame(data)
-        df = pd.concat([df, DF], axis=0).reset_index(drop=True)
-    
-    df = df.drop_duplicates()
-    progress_bar.empty()
-    status_text.empty()
-    return df
 
-def scrape_motos(num_pages):
-    df = pd.DataFrame()
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    for index in range(1, num_pages + 1):
-        status_text.text(f'Scraping page {index}/{num_pages}...')
-        progress_bar.progress(index / num_pages)
-        
-        url = f'https://dakar-auto.com/senegal/motos-and-scooters-3?&page={index}'
-        res = get(url)
-        soup = bs(res.content, 'html.parser')
-        containers = soup.find_all('div', class_='listings-cards__list-item mb-md-3 mb-3')
-        
-        data = []
-        for container in containers:
-            try:
-                gen_inf = container.find('h2', class_='listing-card__header__title mb-md-2 mb-0').a.text.strip().split()
-                brand = gen_inf[0]
-                year = gen_inf[-1]
-                
-                kms_driven = None
-                gen_inf1 = container.find('ul', class_='listing-card__attribute-list list-inline mb-0')
-                if gen_inf1:
-                    gen_inf2 = gen_inf1.find_all('li', class_='listing-card__attribute list-inline-item')
-                    if len(gen_inf2) > 1:
-                        kms_driven = gen_inf2[1].text.replace('km', '')
-                if not kms_driven:
-                    kms_driven = "0"
-                
-                adress = container.find('div', class_='col-12 entry-zone-address').text
-                owner = "".join(container.find('p', class_='time-author m-0').a.text).replace('Par','')
-                price = "".join(container.find('h3', 'listing-card__header__price font-weight-bold text-uppercase mb-0').text.strip().split()).replace('FCFA','')
-                
-                dic = {
-                    "brand": brand, "year": year, "kilometer": kms_driven,
-                    "adress": adress, "owner": owner, "price": price
-                }
-                data.append(dic)
-            except:
-                pass
-        
-        DF = pd.DataFrame(data)
-        df = pd.concat([df, DF], axis=0).reset_index(drop=True)
-    
-    df = df.drop_duplicates()
-    progress_bar.empty()
-    status_text.empty()
-    return df
+    def progress(index, total):
+        status_text.text(f'Scraping page {index}/{total}...')
+        progress_bar.progress(index / total)
 
-def scrape_location(num_pages):
-    df = pd.DataFrame()
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    for index in range(1, num_pages + 1):
-        status_text.text(f'Scraping page {index}/{num_pages}...')
-        progress_bar.progress(index / num_pages)
-        
-        url = f'https://dakar-auto.com/senegal/location-de-voitures-19?&page={index}'
-        res = get(url)
-        soup = bs(res.content, 'html.parser')
-        containers = soup.find_all('div', class_='listings-cards__list-item mb-md-3 mb-3')
-        
-        data = []
-        for container in containers:
-            try:
-                gen_inf = container.find('h2',class_='listing-card__header__title mb-md-2 mb-0').a.text.strip().split()
-                brand = gen_inf[0]
-                year = gen_inf[-1]
-                
-                owner = "".join(container.find('p',class_='time-author m-0').a.text).replace('Par','')
-                adress = container.find('div', class_='col-12 entry-zone-address').text
-                price = "".join(container.find('h3','listing-card__header__price font-weight-bold text-uppercase mb-0').text.strip().split()).replace('FCFA','')
-                
-                dic = {
-                    "brand": brand, "year": year, "adress": adress,
-                    "owner": owner, "price": price
-                }
-                data.append(dic)
-            except:
-                pass
-        
-        DF = pd.DataFrame(data)
-        df = pd.concat([df, DF], axis=0).reset_index(drop=True)
-    
-    df = df.drop_duplicates()
+    df, stats = scrape(category, num_pages, progress, crawl_id)
     progress_bar.empty()
     status_text.empty()
+    return df, stats
+
+def show_crawl_stats(stats):
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric(" Requests", stats.requests)
+    with col2:
+        st.metric(" Cards Kept", stats.kept)
+    with col3:
+        st.metric(" Cards Dropped", stats.dropped, f"{stats.drop_ratio:.0%}", delta_color="inverse")
+    with col4:
+        st.metric(" Yield / Request", f"{stats.yield_per_request:.1f}")
+
+    if stats.ended:
+        st.info(f" Reached the end of the listings after page {stats.ended}")
+    if stats.aborted:
+        st.warning(f" Crawl circuit-broken: {stats.aborted}")
+    if stats.dropped:
+        with st.expander(" Dropped cards"):
+            st.dataframe(stats.drops_frame(), use_container_width=True)
+            st.dataframe(stats.pages_frame(), use_container_width=True)
+
+def load_view(table):
+    # View Data frame: typed rows, fair-price columns and deal scores
+    df = add_fair_price(load_typed(table), table)
+    memory = df.attrs.get('memory')
+    df = df.merge(load_scores(table), on='id', how='left')
+    df.attrs['memory'] = memory
     return df
 
+def history_range(key):
+    # Returns (start, end) dates when archived history is requested, else None
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        include = st.checkbox("Include archived history", key=f"{key}_history")
+    if not include:
+        return None
+    with col2:
+        dates = st.date_input("Scrape dates:", [], key=f"{key}_dates")
+    start = dates[0] if len(dates) > 0 else None
+    end = dates[1] if len(dates) > 1 else start
+    return start, end
+
 # Initialize database
 init_db()
 
@@ -254,7 +135,7 @@ with st.sidebar:
     st.markdown("###  Navigation")
     menu = st.radio(
         "",
-        [" Home", " Scraper", " Dashboard", " View Data", " Web Evaluation App"],
+        [" Home", " Scraper", " Dashboard", " View Data", " Changes", " Web Evaluation App"],
         label_visibility="collapsed"
     )
     
@@ -262,6 +143,13 @@ with st.sidebar:
     st.markdown("### ℹ️ About")
     st.info("DAKA_AUTO_SCRAPER is a powerful tool to scrape and analyze car data from Dakar-Auto.com")
 
+    with st.expander(" Database writer"):
+        metrics = write_metrics()
+        st.metric("Queue depth", metrics['queue_depth'])
+        st.metric("Write latency p50 / p95 (ms)", f"{metrics['p50_ms']:.1f} / {metrics['p95_ms']:.1f}")
+        st.caption(f"{metrics['jobs']} writes in {metrics['batches']} commits "
+                   f"({metrics['jobs_per_commit']:.1f} per commit)")
+
 # HOME PAGE
 if menu == " Home":
     st.markdown("##  Welcome to DAKA_AUTO_SCRAPER!")
@@ -318,24 +206,34 @@ elif menu == " Scraper":
     
     st.markdown("---")
     
+    if "Voitures" in url_choice and "Location" not in url_choice:
+        category, label = 'voitures', 'cars'
+    elif "Motos" in url_choice:
+        category, label = 'motos', 'motos'
+    else:
+        category, label = 'location', 'rental cars'
+    
+    # An interrupted crawl of this category can pick up where it stopped
+    resumable = find_resumable(category)
+    crawl_id = None
+    if resumable:
+        st.info(f" An interrupted crawl of {resumable['num_pages']} pages stopped after "
+                f"{resumable['done']} pages.")
+        if st.checkbox(" Resume it instead of starting a new crawl"):
+            crawl_id = resumable['id']
+            st.caption(f" Resuming crawls the remaining {resumable['num_pages'] - resumable['done']} of its "
+                       f"{resumable['num_pages']} pages; the number of pages above is not used.")
+    
     if st.button(" Start Scraping", use_container_width=True):
         with st.spinner(' Scraping in progress...'):
             try:
-                if "Voitures" in url_choice and "Location" not in url_choice:
-                    df = scrape_voitures(num_pages)
-                    save_to_db(df, 'voitures')
-                    st.success(f' Successfully scraped {len(df)} cars!')
-                    
-                elif "Motos" in url_choice:
-                    df = scrape_motos(num_pages)
-                    save_to_db(df, 'motos')
-                    st.success(f' Successfully scraped {len(df)} motos!')
-                    
-                elif "Location" in url_choice:
-                    df = scrape_location(num_pages)
-                    save_to_db(df, 'location')
-                    st.success(f' Successfully scraped {len(df)} rental cars!')
+                df, stats = scrape_with_progress(category, num_pages, crawl_id)
+                st.success(f' Successfully scraped {len(df)} {label}!')
                 
+                show_crawl_stats(stats)
+                found = load_changes(category, crawl_id=stats.crawl_id)
+                counts = found['kind'].value_counts()
+                st.caption(" Changes in this crawl: " + ", ".join(f"{counts.get(k, 0)} {k}" for k in KINDS))
                 st.balloons()
                 st.dataframe(df, use_container_width=True)
                 
@@ -352,24 +250,26 @@ elif menu == " Dashboard":
     )
     
     table_map = {"Voitures": "voitures", "Motos": "motos", "Location": "location"}
-    df = load_from_db(table_map[data_type])
+    history = history_range("dashboard")
+    if history:
+        summary = summarize_frame(load_history(table_map[data_type], ['brand', 'year', 'price'], *history))
+    else:
+        summary = summarize(table_map[data_type])
     
-    if len(df) > 0:
-        # Remove scraped_date and id for analysis
-        df_clean = df.drop(['scraped_date', 'id'], axis=1, errors='ignore')
-        
+    if summary['records'] > 0:
         # Metrics
-        col1, col2, col3, col4 = st.columns(4)
+        col1, col2, col3, col4, col5 = st.columns(5)
         with col1:
-            st.metric(" Total Records", len(df_clean))
+            st.metric(" Total Records", summary['records'])
         with col2:
-            st.metric(" Unique Brands", df_clean['brand'].nunique())
+            st.metric(" Unique Vehicles", summary['vehicles'] if summary['vehicles'] is not None else "N/A")
         with col3:
-            if 'price' in df_clean.columns:
-                avg_price = df_clean['price'].str.replace(',', '').astype(float).mean()
-                st.metric(" Avg Price (FCFA)", f"{avg_price:,.0f}")
+            st.metric(" Unique Brands", summary['brands'])
         with col4:
-            st.metric(" Latest Year", df_clean['year'].max() if 'year' in df_clean.columns else "N/A")
+            if summary['avg_price'] is not None:
+                st.metric(" Avg Price (FCFA)", f"{summary['avg_price']:,.0f}")
+        with col5:
+            st.metric(" Latest Year", summary['latest_year'])
         
         st.markdown("---")
         
@@ -378,7 +278,7 @@ elif menu == " Dashboard":
         
         with col1:
             # Brand distribution
-            brand_counts = df_clean['brand'].value_counts().head(10)
+            brand_counts = summary['brand_counts']
             fig1 = px.bar(
                 x=brand_counts.values,
                 y=brand_counts.index,
@@ -393,31 +293,49 @@ elif menu == " Dashboard":
         
         with col2:
             # Year distribution
-            if 'year' in df_clean.columns:
-                year_counts = df_clean['year'].value_counts().sort_index()
-                fig2 = px.line(
-                    x=year_counts.index,
-                    y=year_counts.values,
-                    title="Vehicles by Year",
-                    labels={'x': 'Year', 'y': 'Count'},
-                    markers=True
-                )
-                st.plotly_chart(fig2, use_container_width=True)
+            year_counts = summary['year_counts']
+            fig2 = px.line(
+                x=year_counts.index,
+                y=year_counts.values,
+                title="Vehicles by Year",
+                labels={'x': 'Year', 'y': 'Count'},
+                markers=True
+            )
+            st.plotly_chart(fig2, use_container_width=True)
         
-        # Price distribution
-        if 'price' in df_clean.columns:
+        # Price distribution, binned here rather than in the browser
+        if len(summary['prices']):
             st.markdown("###  Price Distribution")
-            df_clean['price_numeric'] = df_clean['price'].str.replace(',', '').astype(float)
-            fig3 = px.histogram(
-                df_clean,
-                x='price_numeric',
-                nbins=30,
-                title="Price Distribution",
-                labels={'price_numeric': 'Price (FCFA)'},
-                color_discrete_sequence=['#667eea']
-            )
+            col1, col2 = st.columns([1, 3])
+            with col1:
+                log_scale = st.checkbox("Log-scale bins", value=True)
+            with col2:
+                clip = st.slider("Keep prices between percentiles:", 0.0, 100.0, (1.0, 99.0), step=0.5)
+            fig3 = price_figure(summary['prices'], nbins=30, log=log_scale, clip=clip)
             st.plotly_chart(fig3, use_container_width=True)
         
+        # Market percentiles from the quantile sketches
+        keys = sketch_keys(table_map[data_type])
+        if len(keys):
+            st.markdown("###  Market Price Percentiles")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                brand = st.selectbox("Brand:", sorted(keys['brand'].unique()))
+            with col2:
+                models = keys[(keys['brand'] == brand) & (keys['model'] != ANY)]['model'].unique()
+                model = st.selectbox("Model:", sorted(models)) if 'model' in COLUMNS[table_map[data_type]] else ''
+            with col3:
+                years = keys[(keys['brand'] == brand) & (keys['model'] == model) & (keys['year'] != ANY)]['year']
+                year = st.selectbox("Year:", [ANY] + sorted(years.unique(), reverse=True))
+            quantiles = price_quantiles(table_map[data_type], brand, model, year)
+            if quantiles:
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("Priced listings", quantiles['n'],
+                            help="Listings of this key with a price, counted at their latest price")
+                col2.metric("P10 (FCFA)", f"{quantiles['p10']:,.0f}")
+                col3.metric("Median (FCFA)", f"{quantiles['p50']:,.0f}")
+                col4.metric("P90 (FCFA)", f"{quantiles['p90']:,.0f}")
+        
     else:
         st.warning(" No data available. Please scrape some data first!")
 
@@ -431,10 +349,23 @@ elif menu == " View Data":
     )
     
     table_map = {"Voitures": "voitures", "Motos": "motos", "Location": "location"}
-    df = load_from_db(table_map[data_type])
+    table = table_map[data_type]
+    history = history_range("view")
+    if history:
+        df = load_history(table, None, *history)
+        index = FacetIndex(df)
+    else:
+        # The prepared frame and its facet index are kept per table and
+        # data/score version, so facet clicks reuse both
+        df, index = view_for((table, table_version(table), table_version(f"{table}_scores")),
+                             lambda: load_view(table))
     
     if len(df) > 0:
         st.success(f" Found {len(df)} records in {data_type} table")
+        memory = df.attrs.get('memory')
+        if memory:
+            st.caption(f" {memory['typed_bytes'] / 1e6:.1f} MB in memory "
+                       f"({memory['raw_bytes'] / 1e6:.1f} MB as loaded, {memory['saving']:.0%} saved)")
         
         # Search and filter
         col1, col2 = st.columns([3, 1])
@@ -443,18 +374,49 @@ elif menu == " View Data":
         with col2:
             if st.button(" Clear Table"):
                 if st.checkbox("Confirm deletion"):
-                    conn = sqlite3.connect('daka_auto.db')
-                    conn.execute(f"DELETE FROM {table_map[data_type]}")
-                    conn.commit()
-                    conn.close()
+                    clear_table(table_map[data_type])
                     st.success(" Table cleared!")
                     st.rerun()
         
+        # Facets: counts and filtering come from the facet index
+        keys = {col: f"facet_{table}_{col}" for col in index.values}
+        for col in index.ranges:
+            bounds = index.bounds(col)
+            if bounds and bounds[0] < bounds[1]:
+                keys[col] = f"facet_{table}_{col}_{bounds[0]:.0f}_{bounds[1]:.0f}"
+        selection = {col: st.session_state.get(key) for col, key in keys.items()}
+        counts = index.counts(selection)
+        
+        with st.expander(" Filters", expanded=True):
+            boxes = st.columns(len(index.values) or 1)
+            for box, col in zip(boxes, index.values):
+                with box:
+                    st.multiselect(f"{col.replace('_', ' ').title()}:", list(index.values[col]), key=keys[col],
+                                   format_func=lambda value, c=counts[col]: f"{value} ({c[value]:,})")
+            boxes = st.columns(2)
+            for box, col in zip(boxes, [col for col in index.ranges if col in keys]):
+                lo, hi = (int(b) for b in index.bounds(col))
+                with box:
+                    st.slider(f"{col.title()}:", lo, hi, (lo, hi), key=keys[col],
+                              step=1 if col == 'year' else max((hi - lo) // 200, 1))
+                    st.caption(f"{counts[col]['selected']:,} matching rows")
+        
+        if any(value for value in selection.values()):
+            df = df.iloc[index.rows(selection)]
+        
         # Filter dataframe
         if search:
             mask = df.astype(str).apply(lambda x: x.str.contains(search, case=False)).any(axis=1)
             df = df[mask]
         
+        # Collapse reposts of the same vehicle to their most recent listing
+        if 'cluster_id' in df.columns and st.checkbox("One row per vehicle (hide reposts)"):
+            df = df.sort_values('scraped_date', ascending=False).drop_duplicates('cluster_id')
+        
+        # Deal scores: how far below comparable listings the price is
+        if 'deal_score' in df.columns and st.checkbox("Best deals first"):
+            df = df.sort_values('deal_score', ascending=False, na_position='last')
+        
         st.dataframe(df, use_container_width=True)
         
         # Download button
@@ -465,528 +427,57 @@ elif menu == " View Data":
             file_name=f"{data_type}_{datetime.now().strftime('%Y%m%d')}.csv",
             mime="text/csv",
         )
+
+        # Price history of one listing
+        with st.expander(" Price history"):
+            listing_id = st.selectbox("Listing id:", df['id'].unique().tolist())
+            if listing_id is not None:
+                prices = price_history(listing_id)
+                fig = px.line(prices, x='scraped_date', y='price', markers=True,
+                              labels={'scraped_date': 'Scraped', 'price': 'Price (FCFA)'})
+                st.plotly_chart(fig, use_container_width=True)
     else:
         st.warning(" No data available in this table. Please scrape some data first!")
 
-# WEB EVALUATION APP PAGE
-elif menu == " Web Evaluation App":
-    st.markdown("##  Web Application Evaluation Forms")
-    
-    st.markdown("### Please fill out one of the evaluation forms below:")
-    
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.markdown("""
-        <div style='background: white; padding: 20px; border-radius: 10px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);'>
-            <h3 style='color: #667eea;'> Google Form</h3>
-            <p>Evaluate the web application using Google Forms</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        st.markdown("<br>", unsafe_allow_html=True)
-        
-        if st.button(" Open Google Form", key="google", use_container_width=True):
-            st.markdown("""
-                <iframe src="https://docs.google.com/forms/d/e/1FAIpQLSeL5dzKVxgxD-rOZqLLiDWmIE1dPhBjeeYcrEl3_EcTGeH2zw/viewform?embedded=true" 
-                width="100%" height="800" frameborder="0" marginheight="0" marginwidth="0">Loading…</iframe>
-            """, unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown("""
-        <div style='background: white; padding: 20px; border-radius: 10px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);'>
-            <h3 style='color: #667eea;'> KoboToolbox Form</h3>
-            <p>Evaluate the web application using KoboToolbox</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        st.markdown("<br>", unsafe_allow_html=True)
-        
-        if st.button(" Open KoboToolbox Form", key="kobo", use_container_width=True):
-            st.markdown("""
-                <iframe src="https://ee.kobotoolbox.org/x/afz6PkAH2MUXehMZW8w42D" 
-                width="100%" height="800" frameborder="0" marginheight="0" marginwidth="0">Loading…</iframe>
-            """, unsafe_allow_html=True)
-    
-    st.markdown("---")
-    st.info(" Tip: You can open the forms in a new tab by right-clicking the buttons and selecting 'Open in new tab'")
-
-# Footer
-st.markdown("---")
-st.markdown("""
-<div style='text-align: center; color: white;'>
-    <p>Made with MARIE | © 2024 DAKA_AUTO_SCRAPER</p>
-</div>
-""", unsafe_allow_html=True) 
-import streamlit as st
-import pandas as pd
-import sqlite3
-from requests import get
-from bs4 import BeautifulSoup as bs
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
-
-# Page configuration
-st.set_page_config(
-    page_title="DAKA_AUTO_SCRAPER",
-    page_icon="🚗",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
-
-# Custom CSS for beautiful design
-st.markdown("""
-    <style>
-    .main {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-    }
-    .stApp {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-    }
-    h1 {
-        color: #ffffff;
-        text-align: center;
-        font-size: 3.5em;
-        text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
-        padding: 20px;
-        animation: glow 2s ease-in-out infinite alternate;
-    }
-    @keyframes glow {
-        from { text-shadow: 2px 2px 4px rgba(0,0,0,0.3); }
-        to { text-shadow: 0 0 20px rgba(255,255,255,0.8); }
-    }
-    .stButton>button {
-        background: linear-gradient(90deg, #FF6B6B 0%, #FFE66D 100%);
-        color: white;
-        font-weight: bold;
-        border-radius: 10px;
-        padding: 15px 30px;
-        border: none;
-        font-size: 1.2em;
-        box-shadow: 0 4px 15px rgba(0,0,0,0.2);
-        transition: all 0.3s ease;
-    }
-    .stButton>button:hover {
-        transform: translateY(-3px);
-        box-shadow: 0 6px 20px rgba(0,0,0,0.3);
-    }
-    .sidebar .sidebar-content {
-        background: linear-gradient(180deg, #4facfe 0%, #00f2fe 100%);
-    }
-    div[data-testid="stMetricValue"] {
-        font-size: 2em;
-        color: #667eea;
-    }
-    </style>
-""", unsafe_allow_html=True)
-
-# Database functions
-def init_db():
-    conn = sqlite3.connect('daka_auto.db')
-    c = conn.cursor()
-    
-    # Table for cars
-    c.execute('''CREATE TABLE IF NOT EXISTS voitures
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  brand TEXT, model TEXT, year TEXT, kilometer TEXT,
-                  fuel_type TEXT, gearbox TEXT, adress TEXT,
-                  owner TEXT, price TEXT, scraped_date TEXT)''')
-    
-    # Table for motos
-    c.execute('''CREATE TABLE IF NOT EXISTS motos
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  brand TEXT, year TEXT, kilometer TEXT,
-                  adress TEXT, owner TEXT, price TEXT, scraped_date TEXT)''')
-    
-    # Table for car rental
-    c.execute('''CREATE TABLE IF NOT EXISTS location
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  brand TEXT, year TEXT, adress TEXT,
-                  owner TEXT, price TEXT, scraped_date TEXT)''')
-    
-    conn.commit()
-    conn.close()
-
-def save_to_db(df, table_name):
-    df['scraped_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    conn = sqlite3.connect('daka_auto.db')
-    df.to_sql(table_name, conn, if_exists='append', index=False)
-    conn.close()
-
-def load_from_db(table_name):
-    conn = sqlite3.connect('daka_auto.db')
-    df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-    conn.close()
-    return df
-
-# Scraping functions
-def scrape_voitures(num_pages):
-    df = pd.DataFrame()
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    for index in range(1, num_pages + 1):
-        status_text.text(f'Scraping page {index}/{num_pages}...')
-        progress_bar.progress(index / num_pages)
-        
-        url = f'https://dakar-auto.com/senegal/voitures-4?&page={index}'
-        res = get(url)
-        soup = bs(res.content, 'html.parser')
-        containers = soup.find_all('div', class_='listings-cards__list-item mb-md-3 mb-3')
-        
-        data = []
-        for container in containers:
-            try:
-                gen_inf = container.find('h2', class_='listing-card__header__title mb-md-2 mb-0').a.text.strip().split()
-                brand = gen_inf[0]
-                model = " ".join(gen_inf[1:len(gen_inf)-1])
-                year = gen_inf[-1]
-                
-                gen_inf1 = container.find('ul', 'listing-card__attribute-list list-inline mb-0')
-                gen_inf2 = gen_inf1.find_all('li', 'listing-card__attribute list-inline-item')
-                kms_driven = gen_inf2[1].text.replace('km','')
-                gearbox = gen_inf2[2].text
-                fuel_type = gen_inf2[3].text
-                
-                adress = container.find('div',class_='col-12 entry-zone-address').text
-                owner = "".join(container.find('p', class_='time-author m-0').a.text).replace('Par','')
-                price = "".join(container.find('h3','listing-card__header__price font-weight-bold text-uppercase mb-0').text.strip().split()).replace('FCFA','')
-                
-                dic = {
-                    "brand": brand, "model": model, "year": year,
-                    "kilometer": kms_driven, "fuel_type": fuel_type,
-                    "gearbox": gearbox, "adress": adress,
-                    "owner": owner, "price": price
-                }
-                data.append(dic)
-            except:
-                pass
-        
-        DF = pd.DataFrame(data)
-        df = pd.concat([df, DF], axis=0).reset_index(drop=True)
-    
-    df = df.drop_duplicates()
-    progress_bar.empty()
-    status_text.empty()
-    return df
-
-def scrape_motos(num_pages):
-    df = pd.DataFrame()
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    for index in range(1, num_pages + 1):
-        status_text.text(f'Scraping page {index}/{num_pages}...')
-        progress_bar.progress(index / num_pages)
-        
-        url = f'https://dakar-auto.com/senegal/motos-and-scooters-3?&page={index}'
-        res = get(url)
-        soup = bs(res.content, 'html.parser')
-        containers = soup.find_all('div', class_='listings-cards__list-item mb-md-3 mb-3')
-        
-        data = []
-        for container in containers:
-            try:
-                gen_inf = container.find('h2', class_='listing-card__header__title mb-md-2 mb-0').a.text.strip().split()
-                brand = gen_inf[0]
-                year = gen_inf[-1]
-                
-                kms_driven = None
-                gen_inf1 = container.find('ul', class_='listing-card__attribute-list list-inline mb-0')
-                if gen_inf1:
-                    gen_inf2 = gen_inf1.find_all('li', class_='listing-card__attribute list-inline-item')
-                    if len(gen_inf2) > 1:
-                        kms_driven = gen_inf2[1].text.replace('km', '')
-                if not kms_driven:
-                    kms_driven = "0"
-                
-                adress = container.find('div', class_='col-12 entry-zone-address').text
-                owner = "".join(container.find('p', class_='time-author m-0').a.text).replace('Par','')
-                price = "".join(container.find('h3', 'listing-card__header__price font-weight-bold text-uppercase mb-0').text.strip().split()).replace('FCFA','')
-                
-                dic = {
-                    "brand": brand, "year": year, "kilometer": kms_driven,
-                    "adress": adress, "owner": owner, "price": price
-                }
-                data.append(dic)
-            except:
-                pass
-        
-        DF = pd.DataFrame(data)
-        df = pd.concat([df, DF], axis=0).reset_index(drop=True)
-    
-    df = df.drop_duplicates()
-    progress_bar.empty()
-    status_text.empty()
-    return df
-
-def scrape_location(num_pages):
-    df = pd.DataFrame()
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    for index in range(1, num_pages + 1):
-        status_text.text(f'Scraping page {index}/{num_pages}...')
-        progress_bar.progress(index / num_pages)
-        
-        url = f'https://dakar-auto.com/senegal/location-de-voitures-19?&page={index}'
-        res = get(url)
-        soup = bs(res.content, 'html.parser')
-        containers = soup.find_all('div', class_='listings-cards__list-item mb-md-3 mb-3')
-        
-        data = []
-        for container in containers:
-            try:
-                gen_inf = container.find('h2',class_='listing-card__header__title mb-md-2 mb-0').a.text.strip().split()
-                brand = gen_inf[0]
-                year = gen_inf[-1]
-                
-                owner = "".join(container.find('p',class_='time-author m-0').a.text).replace('Par','')
-                adress = container.find('div', class_='col-12 entry-zone-address').text
-                price = "".join(container.find('h3','listing-card__header__price font-weight-bold text-uppercase mb-0').text.strip().split()).replace('FCFA','')
-                
-                dic = {
-                    "brand": brand, "year": year, "adress": adress,
-                    "owner": owner, "price": price
-                }
-                data.append(dic)
-            except:
-                pass
-        
-        DF = pd.DataFrame(data)
-        df = pd.concat([df, DF], axis=0).reset_index(drop=True)
-    
-    df = df.drop_duplicates()
-    progress_bar.empty()
-    status_text.empty()
-    return df
-
-# Initialize database
-init_db()
-
-# Main title
-st.markdown("<h1> DAKA_AUTO_SCRAPER </h1>", unsafe_allow_html=True)
-
-# Sidebar
-with st.sidebar:
-    st.image("https://img.icons8.com/clouds/200/000000/car.png")
-    st.markdown("###  Navigation")
-    menu = st.radio(
-        "",
-        [" Home", " Scraper", " Dashboard", " View Data", " Web Evaluation App"],
-        label_visibility="collapsed"
-    )
-    
-    st.markdown("---")
-    st.markdown("### ℹ️ About")
-    st.info("DAKA_AUTO_SCRAPER is a powerful tool to scrape and analyze car data from Dakar-Auto.com")
-
-# HOME PAGE
-if menu == " Home":
-    st.markdown("##  Welcome to DAKA_AUTO_SCRAPER!")
-    
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.markdown("""
-        <div style='background: white; padding: 20px; border-radius: 10px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);'>
-            <h3 style='color: #667eea;'> Cars</h3>
-            <p>Scrape detailed car listings including brand, model, year, and more!</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown("""
-        <div style='background: white; padding: 20px; border-radius: 10px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);'>
-            <h3 style='color: #667eea;'> Motos</h3>
-            <p>Get information about motorcycles and scooters available in Senegal!</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col3:
-        st.markdown("""
-        <div style='background: white; padding: 20px; border-radius: 10px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);'>
-            <h3 style='color: #667eea;'> Rental</h3>
-            <p>Explore car rental options with pricing and availability!</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    st.markdown("---")
-    st.markdown("###  Quick Start Guide")
-    st.markdown("""
-    1. **Go to Scraper** - Choose your data source and number of pages
-    2. **Run the scraper** - Get fresh data from Dakar-Auto.com
-    3. **View Dashboard** - Analyze the scraped data with beautiful charts
-    4. **View Data** - Browse and download your scraped data
-    5. **Web Evaluation** - Fill out evaluation forms
-    """)
-
-# SCRAPER PAGE
-elif menu == " Scraper":
-    st.markdown("##  Start Scraping")
-    
-    col1, col2 = st.columns([2, 1])
-    
-    with col1:
-        url_choice = st.selectbox(
-            " Select data source:",
-            [" Voitures (Cars)", " Motos & Scooters", " Location de Voitures (Car Rental)"]
-        )
-    
-    with col2:
-        num_pages = st.number_input(" Number of pages:", min_value=1, max_value=50, value=1)
-    
-    st.markdown("---")
-    
-    if st.button(" Start Scraping", use_container_width=True):
-        with st.spinner(' Scraping in progress...'):
-            try:
-                if "Voitures" in url_choice and "Location" not in url_choice:
-                    df = scrape_voitures(num_pages)
-                    save_to_db(df, 'voitures')
-                    st.success(f' Successfully scraped {len(df)} cars!')
-                    
-                elif "Motos" in url_choice:
-                    df = scrape_motos(num_pages)
-                    save_to_db(df, 'motos')
-                    st.success(f' Successfully scraped {len(df)} motos!')
-                    
-                elif "Location" in url_choice:
-                    df = scrape_location(num_pages)
-                    save_to_db(df, 'location')
-                    st.success(f' Successfully scraped {len(df)} rental cars!')
-                
-                st.balloons()
-                st.dataframe(df, use_container_width=True)
-                
-            except Exception as e:
-                st.error(f' Error during scraping: {str(e)}')
-
-# DASHBOARD PAGE
-elif menu == " Dashboard":
-    st.markdown("##  Data Analytics Dashboard")
+# CHANGES PAGE
+elif menu == " Changes":
+    st.markdown("##  Market Changes")
     
     data_type = st.selectbox(
-        "Select data to visualize:",
+        "Select data to follow:",
         ["Voitures", "Motos", "Location"]
     )
     
     table_map = {"Voitures": "voitures", "Motos": "motos", "Location": "location"}
-    df = load_from_db(table_map[data_type])
+    runs = change_counts(table_map[data_type])
     
-    if len(df) > 0:
-        # Remove scraped_date and id for analysis
-        df_clean = df.drop(['scraped_date', 'id'], axis=1, errors='ignore')
+    if len(runs) > 0:
+        labels = {row.ts: f"{row.changed_at}" + (f" (crawl {row.crawl_id:.0f})" if pd.notna(row.crawl_id) else " (import)")
+                  for row in runs.itertuples()}
+        ts = st.selectbox("Crawl:", list(labels), format_func=labels.get)
+        run = runs[runs['ts'] == ts].iloc[0]
         
-        # Metrics
-        col1, col2, col3, col4 = st.columns(4)
+        col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric(" Total Records", len(df_clean))
+            st.metric(" New", int(run['new']))
         with col2:
-            st.metric(" Unique Brands", df_clean['brand'].nunique())
+            st.metric(" Removed", int(run['removed']))
         with col3:
-            if 'price' in df_clean.columns:
-                avg_price = df_clean['price'].str.replace(',', '').astype(float).mean()
-                st.metric(" Avg Price (FCFA)", f"{avg_price:,.0f}")
-        with col4:
-            st.metric(" Latest Year", df_clean['year'].max() if 'year' in df_clean.columns else "N/A")
-        
-        st.markdown("---")
-        
-        # Charts
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            # Brand distribution
-            brand_counts = df_clean['brand'].value_counts().head(10)
-            fig1 = px.bar(
-                x=brand_counts.values,
-                y=brand_counts.index,
-                orientation='h',
-                title="Top 10 Brands",
-                labels={'x': 'Count', 'y': 'Brand'},
-                color=brand_counts.values,
-                color_continuous_scale='Viridis'
-            )
-            fig1.update_layout(showlegend=False)
-            st.plotly_chart(fig1, use_container_width=True)
-        
-        with col2:
-            # Year distribution
-            if 'year' in df_clean.columns:
-                year_counts = df_clean['year'].value_counts().sort_index()
-                fig2 = px.line(
-                    x=year_counts.index,
-                    y=year_counts.values,
-                    title="Vehicles by Year",
-                    labels={'x': 'Year', 'y': 'Count'},
-                    markers=True
-                )
-                st.plotly_chart(fig2, use_container_width=True)
-        
-        # Price distribution
-        if 'price' in df_clean.columns:
-            st.markdown("###  Price Distribution")
-            df_clean['price_numeric'] = df_clean['price'].str.replace(',', '').astype(float)
-            fig3 = px.histogram(
-                df_clean,
-                x='price_numeric',
-                nbins=30,
-                title="Price Distribution",
-                labels={'price_numeric': 'Price (FCFA)'},
-                color_discrete_sequence=['#667eea']
-            )
-            st.plotly_chart(fig3, use_container_width=True)
-        
-    else:
-        st.warning(" No data available. Please scrape some data first!")
-
-# VIEW DATA PAGE
-elif menu == " View Data":
-    st.markdown("##  View Scraped Data")
-    
-    data_type = st.selectbox(
-        "Select data to view:",
-        ["Voitures", "Motos", "Location"]
-    )
-    
-    table_map = {"Voitures": "voitures", "Motos": "motos", "Location": "location"}
-    df = load_from_db(table_map[data_type])
-    
-    if len(df) > 0:
-        st.success(f" Found {len(df)} records in {data_type} table")
-        
-        # Search and filter
-        col1, col2 = st.columns([3, 1])
-        with col1:
-            search = st.text_input("🔍 Search in data:", "")
-        with col2:
-            if st.button(" Clear Table"):
-                if st.checkbox("Confirm deletion"):
-                    conn = sqlite3.connect('daka_auto.db')
-                    conn.execute(f"DELETE FROM {table_map[data_type]}")
-                    conn.commit()
-                    conn.close()
-                    st.success(" Table cleared!")
-                    st.rerun()
-        
-        # Filter dataframe
-        if search:
-            mask = df.astype(str).apply(lambda x: x.str.contains(search, case=False)).any(axis=1)
-            df = df[mask]
+            st.metric(" Repriced", int(run['repriced']))
         
-        st.dataframe(df, use_container_width=True)
+        kinds = st.multiselect("Show:", list(KINDS), default=list(KINDS))
+        df = load_changes(table_map[data_type], ts=int(ts), kinds=kinds)
+        df['change_pct'] = ((df['new_price'] - df['old_price']) / df['old_price'] * 100).round(1)
+        st.dataframe(df.drop(columns=['category', 'ts'], errors='ignore'), use_container_width=True)
         
-        # Download button
-        csv = df.to_csv(index=False).encode('utf-8')
         st.download_button(
-            label=" Download CSV",
-            data=csv,
-            file_name=f"{data_type}_{datetime.now().strftime('%Y%m%d')}.csv",
-            mime="text/csv",
+            label=" Download JSONL",
+            data=to_jsonl(df).encode('utf-8'),
+            file_name=f"{data_type}_changes_{datetime.now().strftime('%Y%m%d')}.jsonl",
+            mime="application/jsonl",
         )
     else:
-        st.warning(" No data available in this table. Please scrape some data first!")
+        st.warning(" No changes recorded yet. Run a crawl to start the feed!")
 
 # WEB EVALUATION APP PAGE
 elif menu == " Web Evaluation App":
@@ -1035,8 +526,6 @@ elif menu == " Web Evaluation App":
 st.markdown("---")
 st.markdown("""
 <div style='text-align: center; color: white;'>
-    <p>Made with  by MARIE | © 2024 DAKA_AUTO_SCRAPER</p>
+    <p>Made with MARIE | © 2024 DAKA_AUTO_SCRAPER</p>
 </div>
-
 """, unsafe_allow_html=True)
-
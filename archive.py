@@ -0,0 +1,163 @@
+import os
+import uuid
+import sqlite3
+import argparse
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from glob import glob
+from datetime import datetime, timedelta
+import db
+import sketches
+from db import init_db, reader, write, delete_listings, bump_version, COLUMNS, ATTRIBUTES
+
+ARCHIVE_PATH = os.environ.get('DAKA_AUTO_ARCHIVE', 'archive')
+
+# Cold storage for old observations: Parquet files partitioned as
+# category=<table>/date=<YYYY-MM-DD>/ with typed columns. Each row carries the
+# listing attributes so the live listings row can be dropped once all of its
+# observations have been archived. Year and mileage, scraped text in SQLite,
+# are archived as integers (the digits db.to_typed extracts).
+NUMERIC = ['year', 'kilometer']
+SCHEMA = pa.schema(
+    [('id', pa.int64()), ('fingerprint', pa.int64())]
+    + [(col, pa.int64() if col in NUMERIC else pa.string()) for col in ATTRIBUTES]
+    + [('price', pa.int64()), ('scraped_date', pa.timestamp('s')),
+       ('category', pa.string()), ('date', pa.string())]
+)
+PARTITIONING = ds.partitioning(pa.schema([('category', pa.string()), ('date', pa.string())]), flavor='hive')
+
+
+def _select(category, where, extra=""):
+    cols = ", ".join("l." + col for col in COLUMNS[category])
+    return f'''SELECT o.listing_id AS id, l.fingerprint, {cols}, o.price,
+                      datetime(o.ts, 'unixepoch', 'localtime') AS scraped_date{extra}
+               FROM observations o JOIN listings l ON l.id = o.listing_id
+               WHERE l.category = ? AND {where}'''
+
+def _numeric(df):
+    # Year and mileage as nullable integers
+    for col in NUMERIC:
+        if col in df.columns:
+            df[col] = db.to_typed(df[[col]])[col]
+    return df
+
+def upgrade():
+    # Rewrite files archived before year and mileage were typed; returns
+    # the number of files rewritten
+    rewritten = 0
+    for path in glob(os.path.join(ARCHIVE_PATH, '**', '*.parquet'), recursive=True):
+        schema = pq.read_schema(path)
+        if not any(col in schema.names and schema.field(col).type == pa.string() for col in NUMERIC):
+            continue
+        df = _numeric(pq.ParquetFile(path).read().to_pandas())
+        table = pa.Table.from_pandas(df, schema=pa.schema([SCHEMA.field(col) for col in df.columns]), preserve_index=False)
+        pq.write_table(table, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        rewritten += 1
+    _upgraded.add(ARCHIVE_PATH)
+    return rewritten
+
+_upgraded = set()
+
+def compact(older_than_days=30, vacuum=False):
+    # Move observations older than the cutoff into the archive and drop
+    # listings that no longer have live observations. Only the observations
+    # actually written to Parquet are deleted, so rows inserted meanwhile
+    # with old timestamps (a replay backfill) wait for the next run.
+    # Returns rows moved.
+    cutoff = int((datetime.now() - timedelta(days=older_than_days)).timestamp())
+    # The token keeps two compactions within the same second from writing
+    # (and overwriting) the same file names
+    stamp = f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:12]}"
+    upgrade()
+    moved = {}
+
+    for category in COLUMNS:
+        with reader() as conn:
+            df = pd.read_sql_query(_select(category, "o.ts < ?", ", o.ts"), conn, params=(category, cutoff))
+        if df.empty:
+            continue
+        archived = list(zip(df['id'].tolist(), df.pop('ts').tolist()))
+
+        df = _numeric(df)
+        df['scraped_date'] = pd.to_datetime(df['scraped_date'])
+        df['category'] = category
+        df['date'] = df['scraped_date'].dt.strftime("%Y-%m-%d")
+        table = pa.Table.from_pandas(df, schema=pa.schema([SCHEMA.field(col) for col in df.columns]), preserve_index=False)
+        ds.write_dataset(table, ARCHIVE_PATH, format='parquet', partitioning=PARTITIONING,
+                         basename_template=f"part-{stamp}-{{i}}.parquet",
+                         existing_data_behavior='overwrite_or_ignore')
+
+        write(_drop_archived, category, archived)
+        moved[category] = len(df)
+
+    if vacuum:
+        # VACUUM cannot run inside the writer's transactions
+        conn = sqlite3.connect(db.DB_PATH, timeout=30)
+        conn.execute("VACUUM")
+        conn.close()
+    return moved
+
+def _drop_archived(c, category, archived):
+    # archived: (listing_id, ts) pairs written to Parquet. Their change
+    # feed rows stay; delete_listings leaves them alone.
+    c.executemany("DELETE FROM observations WHERE listing_id = ? AND ts = ?", archived)
+    delete_listings(c, '''category = ? AND NOT EXISTS
+                          (SELECT 1 FROM observations o WHERE o.listing_id = listings.id)''', (category,))
+    # Sketches hold the latest price of each live listing
+    if c.rowcount:
+        sketches.rebuild(c, category)
+    bump_version(c, category)
+
+def load_archive(category, columns=None, start=None, end=None):
+    # Partition filters prune by category/date directories; `columns` limits
+    # which Parquet columns are read at all.
+    cols = columns or ['id', 'fingerprint'] + COLUMNS[category] + ['price', 'scraped_date']
+    if not os.path.isdir(ARCHIVE_PATH):
+        return pd.DataFrame(columns=cols)
+
+    if ARCHIVE_PATH not in _upgraded:
+        upgrade()
+    dataset = ds.dataset(ARCHIVE_PATH, format='parquet', partitioning=PARTITIONING, schema=SCHEMA)
+    expr = ds.field('category') == category
+    if start:
+        expr = expr & (ds.field('date') >= str(start))
+    if end:
+        expr = expr & (ds.field('date') <= str(end))
+    return _numeric(dataset.to_table(columns=cols, filter=expr).to_pandas())
+
+def load_history(category, columns=None, start=None, end=None):
+    # Every observation of a category, live and archived, one row each
+    where, params = "1", [category]
+    if start:
+        where += " AND date(o.ts, 'unixepoch', 'localtime') >= ?"
+        params.append(str(start))
+    if end:
+        where += " AND date(o.ts, 'unixepoch', 'localtime') <= ?"
+        params.append(str(end))
+
+    with reader() as conn:
+        live = pd.read_sql_query(_select(category, where), conn, params=params)
+    live = _numeric(live)
+    live['scraped_date'] = pd.to_datetime(live['scraped_date'])
+
+    if columns:
+        live = live[list(dict.fromkeys(list(columns) + ['fingerprint', 'scraped_date']))]
+    archived = load_archive(category, list(live.columns), start, end)
+    if len(archived):
+        # A compaction interrupted between writing Parquet and deleting the
+        # live rows leaves the same observation in both places.
+        live = pd.concat([archived, live], ignore_index=True).drop_duplicates(['fingerprint', 'scraped_date'])
+    return live[columns] if columns else live.drop(columns='fingerprint')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move old observations into the Parquet archive")
+    parser.add_argument('--older-than', type=int, default=30, help="archive observations older than this many days")
+    parser.add_argument('--vacuum', action='store_true', help="reclaim space in the live database afterwards")
+    args = parser.parse_args()
+    init_db()
+    for category, n in compact(args.older_than, args.vacuum).items():
+        print(f"{category}: archived {n} observations")
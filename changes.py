@@ -0,0 +1,75 @@
+import sys
+import argparse
+
+# Change feed. Every crawl emits one row per market event into `changes`:
+# 'new' when a fingerprint is stored for the first time (or comes back
+# after being removed), 'repriced' when a known fingerprint shows a
+# different price, and 'removed' when a finished crawl that reached the
+# end of the catalogue did not see a listing that was still on the market.
+# New and repriced rows fall out of the fingerprint lookup ingest already
+# does; removals read only the listings still on the market through a
+# partial index, so no step compares whole tables.
+KINDS = ('new', 'removed', 'repriced')
+
+
+def init(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS changes
+                 (id INTEGER PRIMARY KEY,
+                  category TEXT NOT NULL, crawl_id INTEGER, listing_id INTEGER NOT NULL,
+                  kind TEXT NOT NULL, old_price INTEGER, new_price INTEGER, ts INTEGER NOT NULL)''')
+    c.execute('CREATE INDEX IF NOT EXISTS changes_category ON changes (category, ts)')
+    c.execute('CREATE INDEX IF NOT EXISTS changes_crawl ON changes (crawl_id)')
+
+def record(c, category, crawl_id, ts, events):
+    # events: (listing_id, kind, old_price, new_price) tuples
+    c.executemany('''INSERT INTO changes (category, crawl_id, listing_id, kind, old_price, new_price, ts)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                  [(category, crawl_id, listing_id, kind, old, new, ts) for listing_id, kind, old, new in events])
+
+def reached_end(c, crawl_id):
+    # Whether a crawl ran out of listings: its last fetched page was empty
+    # after pages with cards
+    covered = c.execute('''SELECT COUNT(*) FROM crawl_pages
+                           WHERE crawl_id = ? AND status = 'done' AND cards > 0''', (crawl_id,)).fetchone()[0]
+    last = c.execute('''SELECT cards FROM crawl_pages WHERE crawl_id = ? AND status = 'done'
+                        ORDER BY page DESC LIMIT 1''', (crawl_id,)).fetchone()
+    return bool(covered and last and last[0] == 0)
+
+def removals(c, crawl_id):
+    # Mark the listings a finished crawl did not see as removed, when the
+    # crawl reached the end of the catalogue (its last pages were empty).
+    # Listings are sorted newest first and slide down between crawls, so a
+    # crawl that stopped earlier may have missed them further down even at
+    # the same depth as earlier crawls; it is skipped. The count, or NULL
+    # when skipped, is kept in crawls.removals; returns the same.
+    if not reached_end(c, crawl_id):
+        c.execute("UPDATE crawls SET removals = NULL WHERE id = ?", (crawl_id,))
+        return None
+
+    category, ts = c.execute("SELECT category, ts FROM crawls WHERE id = ?", (crawl_id,)).fetchone()
+    gone = c.execute('''SELECT l.id, o.price FROM listings l
+                        LEFT JOIN observations o ON o.listing_id = l.id AND o.ts = l.last_seen
+                        WHERE l.category = ? AND l.last_seen < ? AND l.removed_at IS NULL''',
+                     (category, ts)).fetchall()
+    record(c, category, crawl_id, ts, [(listing_id, 'removed', price, None) for listing_id, price in gone])
+    c.executemany("UPDATE listings SET removed_at = ? WHERE id = ?", [(ts, listing_id) for listing_id, _ in gone])
+    c.execute("UPDATE crawls SET removals = ? WHERE id = ?", (len(gone), crawl_id))
+    return len(gone)
+
+def to_jsonl(df):
+    return df.to_json(orient='records', lines=True, force_ascii=False, date_format='iso')
+
+
+if __name__ == '__main__':
+    from db import init_db, load_changes, COLUMNS
+
+    parser = argparse.ArgumentParser(description="Write the change feed as JSON lines")
+    parser.add_argument('--category', choices=sorted(COLUMNS))
+    parser.add_argument('--crawl', type=int, help="only the changes of this crawl")
+    parser.add_argument('--after', type=int, default=0, help="only changes with a larger id (for polling)")
+    args = parser.parse_args()
+
+    init_db()
+    df = load_changes(args.category, crawl_id=args.crawl, after=args.after)
+    if len(df):
+        sys.stdout.write(to_jsonl(df))
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Dashboard aggregates. Everything sent to the browser is already binned or
+# counted here, so chart payloads stay the same size whatever the row count.
+TOP_BRANDS = 10
+
+
+def summarize_frame(df):
+    # Same shape as db.summarize, for frames loaded from the archive
+    prices = pd.to_numeric(df['price'], errors='coerce').dropna().to_numpy()
+    return {
+        'records': len(df),
+        'vehicles': df['cluster_id'].nunique() if 'cluster_id' in df.columns else None,
+        'brands': df['brand'].nunique(),
+        'avg_price': prices.mean() if len(prices) else None,
+        'latest_year': df['year'].max(),
+        'brand_counts': df['brand'].value_counts().head(TOP_BRANDS),
+        'year_counts': df['year'].value_counts().sort_index(),
+        'prices': prices,
+    }
+
+def histogram(values, nbins=30, log=False, clip=(0, 100)):
+    # Returns (counts, edges) after dropping values outside the `clip`
+    # percentiles; log-spaced bins when `log` is set.
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values) & ((values > 0) if log else True)]
+    if not len(values):
+        return np.array([], dtype=int), np.array([])
+    lo, hi = np.percentile(values, clip)
+    values = values[(values >= lo) & (values <= hi)]
+    if hi <= lo:
+        hi = lo + 1
+    edges = np.geomspace(lo, hi, nbins + 1) if log else np.linspace(lo, hi, nbins + 1)
+    counts, edges = np.histogram(values, edges)
+    return counts, edges
+
+def fmt_fcfa(value):
+    for size, suffix in ((1e9, 'B'), (1e6, 'M'), (1e3, 'k')):
+        if abs(value) >= size:
+            return f"{value / size:.3g}{suffix}"
+    return f"{value:.0f}"
+
+def price_figure(prices, nbins=30, log=False, clip=(0, 100)):
+    counts, edges = histogram(prices, nbins, log, clip)
+    labels = [f"{fmt_fcfa(a)}–{fmt_fcfa(b)}" for a, b in zip(edges[:-1], edges[1:])]
+    fig = go.Figure(go.Bar(x=labels, y=counts, marker_color='#667eea'))
+    fig.update_layout(title="Price Distribution", xaxis_title="Price (FCFA)", yaxis_title="Count", bargap=0.05)
+    return fig
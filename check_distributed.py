@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import signal
+import tempfile
+import argparse
+import threading
+
+# End-to-end check of distributed crawls against the local stand-in server
+# (standin.py), in a throwaway database. Two scenarios:
+#   kill:   local workers crawl a catalogue while one of them is SIGKILLed
+#           holding a lease; its range must be reclaimed after the lease
+#           runs out and the crawl must finish with every listing stored
+#           exactly once.
+#   broken: every card lacks a price; the per-lease circuit breaker must
+#           abort the crawl after a few pages instead of fetching them all.
+# Exits 1 when a check fails.
+#
+#   python check_distributed.py --workers 3
+WORK = tempfile.mkdtemp(prefix='daka_auto_check_')
+os.environ['DAKA_AUTO_DB'] = os.path.join(WORK, 'check.db')
+os.environ['DAKA_AUTO_HTML'] = os.path.join(WORK, 'html')
+os.environ['DAKA_AUTO_ARCHIVE'] = os.path.join(WORK, 'archive')
+
+import standin
+server = standin.start()
+os.environ['DAKA_AUTO_BASE_URL'] = f"http://127.0.0.1:{server.server_address[1]}"
+
+import distributed
+from db import init_db, reader, fingerprint
+from scraper import parse_page
+
+CATEGORY = 'voitures'
+
+
+def expected(pages):
+    # Distinct fingerprints on the stand-in pages 1..pages
+    return len({fingerprint(CATEGORY, row)
+                for n in range(1, pages + 1) for row in parse_page(CATEGORY, standin.page(CATEGORY, n, pages))[0]})
+
+def kill_one_worker(done, killed):
+    # SIGKILL the first worker process seen holding a lease
+    while not done.is_set():
+        with reader() as conn:
+            row = conn.execute("SELECT worker FROM crawl_leases WHERE status = 'leased' LIMIT 1").fetchone()
+        if row:
+            pid = int(row[0].rsplit(':', 1)[1])
+            if pid != os.getpid():
+                os.kill(pid, signal.SIGKILL)
+                killed.append(pid)
+                return
+        time.sleep(0.05)
+
+def run(pages, broken, workers, lease_pages, lease_seconds, kill):
+    handler = server.RequestHandlerClass
+    handler.pages, handler.broken, handler.delay = pages, broken, 0.05
+    done, killed = threading.Event(), []
+    if kill:
+        threading.Thread(target=kill_one_worker, args=(done, killed), daemon=True).start()
+    started = time.perf_counter()
+    result = distributed.coordinate([CATEGORY], pages * 2, workers, lease_pages, lease_seconds,
+                                    log=lambda *args: None).iloc[0]
+    done.set()
+    print(result.to_string(), f"\nkilled: {killed or '-'}  {time.perf_counter() - started:.1f}s\n")
+    return result, killed
+
+def check(name, ok, failures):
+    print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    if not ok:
+        failures.append(name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check distributed crawls against the local stand-in server")
+    parser.add_argument('--pages', type=int, default=12, help="pages with listings in the stand-in catalogue")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--lease-pages', type=int, default=3)
+    parser.add_argument('--lease-seconds', type=int, default=3)
+    args = parser.parse_args()
+
+    init_db()
+    failures = []
+
+    print(f"kill: {args.workers} workers, {args.pages} pages, one worker SIGKILLed")
+    result, killed = run(args.pages, 0.0, args.workers, args.lease_pages, args.lease_seconds, kill=True)
+    with reader() as conn:
+        stored = conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+        missing = conn.execute('''SELECT COUNT(*) FROM crawl_pages WHERE crawl_id = ? AND page <= ?
+                                  AND status != 'done' ''', (int(result.crawl_id), args.pages)).fetchone()[0]
+    check("crawl finished", result.status == 'done', failures)
+    check("a worker was killed", bool(killed), failures)
+    check("its range was reclaimed", (result.reclaimed or 0) >= 1, failures)
+    check("every catalogue page crawled", missing == 0, failures)
+    check("every listing stored once", stored == result.listings == expected(args.pages), failures)
+
+    print(f"\nbroken: {args.workers} workers, every card without a price")
+    result, _ = run(args.pages, 1.0, args.workers, args.lease_pages, args.lease_seconds, kill=False)
+    check("crawl aborted", result.status == 'aborted', failures)
+    check("stopped early", result.pages_done <= args.workers * args.lease_pages, failures)
+    check("no range left open", distributed.pending([int(result.crawl_id)]) == 0, failures)
+
+    server.shutdown()
+    print(f"\n{len(failures)} failed" if failures else "\nall checks passed")
+    sys.exit(1 if failures else 0)
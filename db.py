@@ -0,0 +1,527 @@
+import os
+import re
+import time
+import queue
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+import dedup
+import changes
+import sketches
+from sketches import ANY
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+
+DB_PATH = os.environ.get('DAKA_AUTO_DB', 'daka_auto.db')
+
+# Storage model: one row per unique listing in `listings`, and one compact
+# (listing_id, ts, price) row per crawl that saw it in `observations`.
+# The voitures/motos/location names are views showing the latest
+# observation of each listing in the original column layout.
+COLUMNS = {
+    'voitures': ['brand', 'model', 'year', 'kilometer', 'fuel_type', 'gearbox', 'adress', 'owner'],
+    'motos': ['brand', 'year', 'kilometer', 'adress', 'owner'],
+    'location': ['brand', 'year', 'adress', 'owner'],
+}
+ATTRIBUTES = ['brand', 'model', 'year', 'kilometer', 'fuel_type', 'gearbox', 'adress', 'owner']
+
+
+# All writes in a process go through one writer thread that owns the only
+# read-write connection. Jobs are queued as fn(cursor, *args) and the writer
+# runs whatever is waiting (up to WRITE_BATCH jobs) in a single transaction,
+# one savepoint per job, so a failing job is rolled back on its own and a
+# burst of writes from several sessions costs one commit. Reads use a small
+# pool of read-only connections; in WAL mode they never wait for the writer.
+WRITE_BATCH = 64
+WRITE_LINGER = 0.005
+READ_POOL = 8
+
+
+class Writer:
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.Queue()
+        self.latencies = deque(maxlen=1000)
+        self.batches = 0
+        self.jobs = 0
+        # Opened here so a database that cannot be opened fails the caller
+        # instead of the thread
+        self.conn = self._connect()
+        self.thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+        self.thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.queue.put((fn, args, future, time.perf_counter()))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < WRITE_BATCH:
+                    batch.append(self.queue.get(timeout=WRITE_LINGER))
+            except queue.Empty:
+                pass
+            try:
+                self._commit(self.conn, batch)
+            except Exception as e:
+                # Not even the rollback went through: fail the batch and go
+                # on with a fresh connection, so no caller waits forever
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self._reopen()
+
+    def _reopen(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        try:
+            self.conn = self._connect()
+        except Exception:
+            # Keep the closed connection; the next batch fails and retries
+            pass
+
+    def _commit(self, conn, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args, future, _ in batch:
+                conn.execute("SAVEPOINT job")
+                try:
+                    results.append((future, fn(conn.cursor(), *args), None))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    results.append((future, None, e))
+                conn.execute("RELEASE job")
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            results = [(future, None, e) for _, _, future, _ in batch]
+
+        done = time.perf_counter()
+        self.batches += 1
+        self.jobs += len(batch)
+        for (_, _, _, queued), (future, result, error) in zip(batch, results):
+            self.latencies.append(done - queued)
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+        pick = lambda q: latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000 if latencies else 0.0
+        return {
+            'queue_depth': self.queue.qsize(),
+            'p50_ms': pick(0.5), 'p95_ms': pick(0.95),
+            'batches': self.batches, 'jobs': self.jobs,
+            'jobs_per_commit': self.jobs / self.batches if self.batches else 0.0,
+        }
+
+
+_writers = {}
+_readers = {}
+_initialised = set()
+_lock = threading.Lock()
+
+def writer():
+    with _lock:
+        if DB_PATH not in _writers:
+            _writers[DB_PATH] = Writer(DB_PATH)
+        return _writers[DB_PATH]
+
+def write(fn, *args):
+    # Run fn(cursor, *args) on the writer thread and wait for its commit
+    return writer().submit(fn, *args).result()
+
+def write_metrics():
+    return writer().metrics()
+
+@contextmanager
+def reader():
+    with _lock:
+        pool = _readers.setdefault(DB_PATH, queue.LifoQueue())
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, timeout=30, check_same_thread=False)
+    try:
+        yield conn
+    finally:
+        if pool.qsize() < READ_POOL:
+            pool.put(conn)
+        else:
+            conn.close()
+
+def init_db():
+    # Once per process; Streamlit calls this on every rerun of every session
+    if DB_PATH not in _initialised:
+        write(_create_schema)
+        _initialised.add(DB_PATH)
+
+def _create_schema(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS listings
+                 (id INTEGER PRIMARY KEY,
+                  category TEXT NOT NULL, fingerprint INTEGER NOT NULL UNIQUE,
+                  brand TEXT, model TEXT, year TEXT, kilometer TEXT,
+                  fuel_type TEXT, gearbox TEXT, adress TEXT, owner TEXT,
+                  first_seen INTEGER, last_seen INTEGER,
+                  cluster_id INTEGER, minhash BLOB, removed_at INTEGER)''')
+    ensure_column(c, 'listings', 'cluster_id', 'INTEGER')
+    ensure_column(c, 'listings', 'minhash', 'BLOB')
+    ensure_column(c, 'listings', 'removed_at', 'INTEGER')
+    c.execute('CREATE INDEX IF NOT EXISTS listings_category ON listings (category, last_seen)')
+    c.execute('CREATE INDEX IF NOT EXISTS listings_cluster ON listings (cluster_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS listings_listed ON listings (category, last_seen) WHERE removed_at IS NULL')
+    dedup.init(c)
+    sketches.init(c)
+    changes.init(c)
+
+    c.execute('''CREATE TABLE IF NOT EXISTS observations
+                 (listing_id INTEGER NOT NULL REFERENCES listings (id),
+                  ts INTEGER NOT NULL, price INTEGER,
+                  PRIMARY KEY (listing_id, ts)) WITHOUT ROWID''')
+
+    # Crawl checkpoints: one crawls row per run, its pages with their
+    # status, and the fingerprints already stored by the run.
+    c.execute('''CREATE TABLE IF NOT EXISTS crawls
+                 (id INTEGER PRIMARY KEY,
+                  category TEXT NOT NULL, num_pages INTEGER NOT NULL,
+                  ts INTEGER NOT NULL, status TEXT NOT NULL DEFAULT 'running',
+                  cursor INTEGER, note TEXT, updated INTEGER, removals INTEGER)''')
+    ensure_column(c, 'crawls', 'removals', 'INTEGER')
+    c.execute('CREATE INDEX IF NOT EXISTS crawls_status ON crawls (category, status)')
+    c.execute('''CREATE TABLE IF NOT EXISTS crawl_pages
+                 (crawl_id INTEGER NOT NULL REFERENCES crawls (id), page INTEGER NOT NULL,
+                  status TEXT NOT NULL DEFAULT 'pending',
+                  cards INTEGER, kept INTEGER, dropped INTEGER, drops TEXT,
+                  PRIMARY KEY (crawl_id, page)) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS crawl_seen
+                 (crawl_id INTEGER NOT NULL REFERENCES crawls (id), fingerprint INTEGER NOT NULL,
+                  PRIMARY KEY (crawl_id, fingerprint)) WITHOUT ROWID''')
+    # One row per fetched page; the HTML itself is in html_archive.HTML_PATH
+    c.execute('''CREATE TABLE IF NOT EXISTS page_fetches
+                 (id INTEGER PRIMARY KEY,
+                  crawl_id INTEGER REFERENCES crawls (id), category TEXT NOT NULL, page INTEGER,
+                  url TEXT, status INTEGER, sha256 TEXT NOT NULL, size INTEGER, ts INTEGER NOT NULL)''')
+    c.execute('CREATE INDEX IF NOT EXISTS page_fetches_crawl ON page_fetches (crawl_id, page)')
+
+    # Page ranges of distributed crawls, leased to one worker at a time
+    # (see distributed.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS crawl_leases
+                 (crawl_id INTEGER NOT NULL REFERENCES crawls (id),
+                  first_page INTEGER NOT NULL, last_page INTEGER NOT NULL,
+                  status TEXT NOT NULL DEFAULT 'open', worker TEXT, expires INTEGER, attempts INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (crawl_id, first_page)) WITHOUT ROWID''')
+
+    # Deal scores and the per-category price models behind them (scoring.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS price_models
+                 (category TEXT PRIMARY KEY, version INTEGER NOT NULL, n INTEGER NOT NULL,
+                  fitted INTEGER NOT NULL, model TEXT NOT NULL)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS listing_scores
+                 (listing_id INTEGER PRIMARY KEY, category TEXT NOT NULL, price INTEGER,
+                  expected_price INTEGER, score REAL, model_version INTEGER NOT NULL) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS listing_scores_category ON listing_scores (category, score)')
+
+    # Bumped by every write that changes what a category view returns;
+    # caches and ETags are keyed on it.
+    c.execute('''CREATE TABLE IF NOT EXISTS table_versions
+                 (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)''')
+
+    reclustered = dedup.reset_stale(c)
+    resketch = sketches.scheme_changed(c)
+    for category in COLUMNS:
+        migrate_legacy(c, category)
+        unclustered = c.execute("SELECT id FROM listings WHERE category = ? AND cluster_id IS NULL ORDER BY id",
+                                (category,)).fetchall()
+        dedup.assign_clusters(c, category, [r[0] for r in unclustered])
+        if reclustered:
+            bump_version(c, category)
+        c.execute(f"DROP VIEW IF EXISTS {category}")
+        c.execute(f'''CREATE VIEW {category} AS
+                      SELECT l.id, {", ".join("l." + col for col in COLUMNS[category])},
+                             o.price, l.cluster_id, datetime(o.ts, 'unixepoch', 'localtime') AS scraped_date
+                      FROM listings l
+                      JOIN observations o ON o.listing_id = l.id AND o.ts = l.last_seen
+                      WHERE l.category = '{category}' ''')
+
+        # Sketches start from the current prices the first time they exist
+        if resketch or not c.execute("SELECT 1 FROM price_sketches WHERE category = ? LIMIT 1", (category,)).fetchone():
+            sketches.rebuild(c, category)
+
+def ensure_column(c, table, column, decl):
+    # Columns added after a table was first created
+    if column not in [r[1] for r in c.execute(f"PRAGMA table_info({table})")]:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def migrate_legacy(c, category):
+    # Fold a pre-observation-model table (one full TEXT row per scrape) into
+    # listings/observations, then drop it so its name can become a view.
+    kind = c.execute("SELECT type FROM sqlite_master WHERE name = ?", (category,)).fetchone()
+    if not kind or kind[0] != 'table':
+        return
+
+    c.execute(f"SELECT * FROM {category}")
+    names = [d[0] for d in c.description]
+    rows = [dict(zip(names, r)) for r in c.fetchall()]
+    by_ts = {}
+    for row in rows:
+        by_ts.setdefault(to_ts(row.get('scraped_date')), []).append(row)
+    for ts, batch in sorted(by_ts.items()):
+        ingest(c, category, batch, ts)
+
+    c.execute(f"DROP TABLE {category}")
+
+def to_ts(scraped_date):
+    try:
+        return int(datetime.strptime(scraped_date, "%Y-%m-%d %H:%M:%S").timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+def parse_price(price):
+    digits = re.sub(r'\D', '', str(price)) if price is not None else ''
+    return int(digits) if digits else None
+
+def clean(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    return str(value).strip()
+
+def fingerprint(category, row):
+    # 64-bit identity of a listing; price is left out so a repriced listing
+    # keeps its id and only gains a new observation.
+    key = "|".join([category] + [clean(row.get(col)) or '' for col in ATTRIBUTES])
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+def bump_version(c, table_name):
+    c.execute('''INSERT INTO table_versions (name, version) VALUES (?, 1)
+                 ON CONFLICT (name) DO UPDATE SET version = version + 1''', (table_name,))
+
+def table_version(table_name):
+    with reader() as conn:
+        row = conn.execute("SELECT version FROM table_versions WHERE name = ?", (table_name,)).fetchone()
+    return row[0] if row else 0
+
+def ingest(c, category, rows, ts, crawl_id=None):
+    # Upsert listings and record one observation each; returns listing ids.
+    # Prices of new listings go into the quantile sketches, repriced ones
+    # replace their old price there, and both are logged to the change feed.
+    ids, priced, events = [], [], []
+    for row in rows:
+        fp = fingerprint(category, row)
+        price = parse_price(row.get('price'))
+        found = c.execute('''SELECT l.id, o.price, l.last_seen, l.removed_at FROM listings l
+                             LEFT JOIN observations o ON o.listing_id = l.id AND o.ts = l.last_seen
+                             WHERE l.fingerprint = ?''', (fp,)).fetchone()
+        if found:
+            # Rows older than the latest observation (replayed history) only
+            # fill in the past: no sketch update, change event or relisting
+            listing_id, last_price, last_seen, removed_at = found
+            latest = ts >= last_seen
+            relisted = removed_at is not None and ts >= removed_at
+            c.execute('''UPDATE listings SET first_seen = min(first_seen, ?), last_seen = max(last_seen, ?),
+                                             removed_at = CASE WHEN ? THEN NULL ELSE removed_at END
+                         WHERE id = ?''', (ts, ts, relisted, listing_id))
+            if latest and price != last_price:
+                priced.append((row, last_price, price))
+            if relisted:
+                events.append((listing_id, 'new', last_price, price))
+            elif latest and price != last_price and price is not None and last_price is not None:
+                events.append((listing_id, 'repriced', last_price, price))
+        else:
+            values = [clean(row.get(col)) for col in ATTRIBUTES]
+            c.execute(f'''INSERT INTO listings
+                          (category, fingerprint, {", ".join(ATTRIBUTES)}, first_seen, last_seen)
+                          VALUES (?, ?, {", ".join("?" * len(ATTRIBUTES))}, ?, ?)''',
+                      [category, fp] + values + [ts, ts])
+            listing_id = c.lastrowid
+            priced.append((row, None, price))
+            events.append((listing_id, 'new', None, price))
+        c.execute("INSERT OR REPLACE INTO observations (listing_id, ts, price) VALUES (?, ?, ?)",
+                  (listing_id, ts, price))
+        ids.append(listing_id)
+    dedup.assign_clusters(c, category, ids)
+    sketches.update(c, category, priced)
+    changes.record(c, category, crawl_id, ts, events)
+    if ids:
+        bump_version(c, category)
+    return ids
+
+# Column types for load_typed: low-cardinality text as categoricals,
+# numbers (stored as scraped text for year/kilometer) as nullable ints.
+CATEGORICAL = ['brand', 'model', 'fuel_type', 'gearbox', 'adress', 'category']
+INTEGER = ['id', 'year', 'kilometer', 'price', 'cluster_id']
+LOAD_CHUNK = 50_000
+
+def to_typed(df):
+    df = df.copy()
+    for col in df.columns:
+        if col in CATEGORICAL:
+            df[col] = df[col].astype('category')
+        elif col in INTEGER:
+            values = df[col]
+            if not pd.api.types.is_numeric_dtype(values):
+                values = pd.to_numeric(values.astype('string').str.replace(r'\D', '', regex=True).replace('', pd.NA))
+            df[col] = values.astype('Int64')
+        elif col == 'scraped_date':
+            df[col] = pd.to_datetime(df[col], format="%Y-%m-%d %H:%M:%S", errors='coerce')
+    return df
+
+def load_typed(table_name, columns=None, chunksize=LOAD_CHUNK):
+    # Rows of a category view with compact dtypes, converted chunk by
+    # chunk so the all-object frame never exists in full. The memory used
+    # as loaded vs typed is left in df.attrs['memory'].
+    select = ", ".join(columns) if columns else "*"
+    parts, raw_bytes = [], 0
+    with reader() as conn:
+        for chunk in pd.read_sql_query(f"SELECT {select} FROM {table_name}", conn, chunksize=chunksize):
+            raw_bytes += int(chunk.memory_usage(index=False, deep=True).sum())
+            parts.append(to_typed(chunk))
+        if not parts:
+            parts.append(to_typed(pd.read_sql_query(f"SELECT {select} FROM {table_name} LIMIT 0", conn)))
+
+    # Chunks have their own category sets; union them before joining
+    cats = [col for col in parts[0].columns if col in CATEGORICAL]
+    df = pd.concat([part.drop(columns=cats) for part in parts], ignore_index=True)
+    for col in cats:
+        df[col] = pd.api.types.union_categoricals([part[col] for part in parts], sort_categories=True)
+    df = df[parts[0].columns]
+    typed_bytes = int(df.memory_usage(index=False, deep=True).sum())
+    df.attrs['memory'] = {'rows': len(df), 'raw_bytes': raw_bytes, 'typed_bytes': typed_bytes,
+                          'saving': 1 - typed_bytes / raw_bytes if raw_bytes else 0.0}
+    return df
+
+def summarize(table_name, top_brands=10):
+    # Dashboard metrics and chart inputs computed in SQL; only the price
+    # column is fetched row by row, for binning in charts.histogram.
+    with reader() as conn:
+        records, vehicles, brands, avg_price, latest_year = conn.execute(
+            f"SELECT COUNT(*), COUNT(DISTINCT cluster_id), COUNT(DISTINCT brand), AVG(price), MAX(year) FROM {table_name}"
+        ).fetchone()
+        brand_counts = conn.execute(f'''SELECT brand, COUNT(*) AS n FROM {table_name}
+                                         GROUP BY brand ORDER BY n DESC LIMIT ?''', (top_brands,)).fetchall()
+        year_counts = conn.execute(f"SELECT year, COUNT(*) FROM {table_name} GROUP BY year ORDER BY year").fetchall()
+        prices = np.fromiter((r[0] for r in conn.execute(f"SELECT price FROM {table_name} WHERE price IS NOT NULL")),
+                             dtype=np.int64)
+    return {
+        'records': records, 'vehicles': vehicles, 'brands': brands,
+        'avg_price': avg_price, 'latest_year': latest_year,
+        'brand_counts': pd.Series(dict(brand_counts), dtype='int64'),
+        'year_counts': pd.Series(dict(year_counts), dtype='int64'),
+        'prices': prices,
+    }
+
+def price_quantiles(category, brand, model='', year=ANY, qs=(0.1, 0.5, 0.9)):
+    # Price percentiles for one sketch key, or None when it does not exist
+    with reader() as conn:
+        found = conn.execute('''SELECT digest FROM price_sketches
+                                WHERE category = ? AND brand = ? AND model = ? AND year = ?''',
+                             (category, brand, model, year)).fetchone()
+    if not found:
+        return None
+    digest = sketches.TDigest.from_bytes(found[0])
+    return {'n': int(digest.count), **{f"p{round(q * 100)}": digest.quantile(q) for q in qs}}
+
+def sketch_keys(category):
+    with reader() as conn:
+        return pd.read_sql_query('''SELECT brand, model, year, n FROM price_sketches
+                                    WHERE category = ? ORDER BY brand, model, year''', conn, params=(category,))
+
+def _key_text(df, col):
+    # Sketch key column as stripped text ('' when missing), like sketches.keys
+    if col not in df.columns:
+        return pd.Series('', index=df.index)
+    return df[col].astype('string').str.strip().fillna('')
+
+def add_fair_price(df, category, low=0.25, high=0.75):
+    # Where each listing's price sits in its market (percentile from the
+    # most specific sketch with enough prices) and a label for it. Rows are
+    # grouped by sketch key, so each sketch is looked up once and its CDF
+    # evaluated for the whole group at once.
+    with reader() as conn:
+        digests = sketches.load(conn, category)
+    prices = pd.to_numeric(df['price'], errors='coerce').to_numpy(dtype=float, na_value=np.nan) \
+        if 'price' in df.columns else np.full(len(df), np.nan)
+    medians, positions = np.full(len(df), np.nan), np.full(len(df), np.nan)
+    keyed = pd.DataFrame({col: _key_text(df, col).to_numpy() for col in ('brand', 'model', 'year')})
+    for (brand, model, year), rows in keyed.groupby(['brand', 'model', 'year'], sort=False).indices.items():
+        digest = sketches.lookup(digests, category, {'brand': brand, 'model': model, 'year': year})
+        if digest is not None:
+            medians[rows] = digest.quantile(0.5)
+            positions[rows] = digest.cdf(prices[rows])
+
+    df = df.copy()
+    df['market_median'] = pd.array(np.round(medians), dtype='Float64').astype('Int64')
+    df['price_percentile'] = pd.array(positions, dtype='Float64').round(2)
+    df['fair_price'] = np.select([np.isnan(positions), positions < low, positions > high],
+                                 ['', 'below market', 'above market'], 'fair')
+    return df
+
+def delete_listings(c, where, params=()):
+    # Remove listings matching `where` together with their index rows. The
+    # change feed keeps their events (see _clear for wiping a category).
+    c.execute(f"DELETE FROM lsh_buckets WHERE listing_id IN (SELECT id FROM listings WHERE {where})", params)
+    c.execute(f"DELETE FROM listing_scores WHERE listing_id IN (SELECT id FROM listings WHERE {where})", params)
+    c.execute(f"DELETE FROM listings WHERE {where}", params)
+
+def _clear(c, table_name):
+    c.execute('''DELETE FROM observations WHERE listing_id IN
+                 (SELECT id FROM listings WHERE category = ?)''', (table_name,))
+    delete_listings(c, "category = ?", (table_name,))
+    c.execute("DELETE FROM changes WHERE category = ?", (table_name,))
+    c.execute("DELETE FROM price_sketches WHERE category = ?", (table_name,))
+    c.execute("DELETE FROM price_models WHERE category = ?", (table_name,))
+    bump_version(c, table_name)
+
+def clear_table(table_name):
+    write(_clear, table_name)
+
+def load_changes(category=None, crawl_id=None, ts=None, after=0, kinds=None):
+    # Change feed rows with the listing attributes, oldest first
+    where, args = ["ch.id > ?"], [after]
+    for column, value in (('ch.category', category), ('ch.crawl_id', crawl_id), ('ch.ts', ts)):
+        if value is not None:
+            where.append(f"{column} = ?")
+            args.append(value)
+    if kinds:
+        where.append(f"ch.kind IN ({', '.join('?' * len(kinds))})")
+        args += list(kinds)
+    with reader() as conn:
+        df = pd.read_sql_query(f'''SELECT ch.id, ch.category, ch.crawl_id, ch.kind, ch.listing_id,
+                                          l.brand, l.model, l.year, l.kilometer, l.adress, l.owner,
+                                          ch.old_price, ch.new_price,
+                                          datetime(ch.ts, 'unixepoch', 'localtime') AS changed_at
+                                   FROM changes ch LEFT JOIN listings l ON l.id = ch.listing_id
+                                   WHERE {" AND ".join(where)} ORDER BY ch.id''', conn, params=args)
+    df['old_price'] = df['old_price'].astype('Int64')
+    df['new_price'] = df['new_price'].astype('Int64')
+    return df
+
+def change_counts(category):
+    # One row per crawl or import that produced changes, newest first
+    sums = ", ".join(f"SUM(kind = '{kind}') AS {kind}" for kind in changes.KINDS)
+    with reader() as conn:
+        return pd.read_sql_query(f'''SELECT ts, MAX(crawl_id) AS crawl_id,
+                                          datetime(ts, 'unixepoch', 'localtime') AS changed_at, {sums}
+                                   FROM changes WHERE category = ? GROUP BY ts ORDER BY ts DESC''',
+                                 conn, params=(category,))
+
+def price_history(listing_id):
+    with reader() as conn:
+        return pd.read_sql_query('''SELECT datetime(ts, 'unixepoch', 'localtime') AS scraped_date, price
+                                    FROM observations WHERE listing_id = ? ORDER BY ts''',
+                                 conn, params=(listing_id,))
@@ -0,0 +1,148 @@
+import re
+import hashlib
+import unicodedata
+import numpy as np
+
+# Near-duplicate (repost) detection. Each listing gets a MinHash signature
+# over shingles of its normalised attributes; signatures are split into
+# BANDS bands of ROWS values and every band is hashed into lsh_buckets.
+# Listings sharing a bucket are candidates. A listing joins a candidate's
+# cluster when its estimated Jaccard similarity reaches SIMILARITY and it
+# passes `same_vehicle` (same seller; mileage, fuel and gearbox
+# compatible) against every member of that cluster, so clusters never
+# chain through listings that each resemble only some members. Lookups touch only a listing's own
+# buckets and the members of matching clusters, so assignment cost does
+# not grow with the table and new pages can be clustered as they arrive.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SIMILARITY = 0.6
+KM_BUCKET = 5000
+KM_TOLERANCE = 0.1
+
+# Bumped whenever shingles or the verification change; init_db then drops
+# the clusters built under the older scheme and assigns them again.
+SCHEME = 3
+
+# Listing columns a new listing is verified against
+MEMBER_COLUMNS = ('minhash', 'kilometer', 'fuel_type', 'gearbox', 'owner')
+
+# One seed per permutation; shingle hashes are xored with it and run
+# through the SplitMix64 finaliser.
+_SEEDS = np.random.default_rng(1_000_003).integers(0, 1 << 63, NUM_PERM, dtype=np.uint64)
+
+
+def init(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS lsh_buckets
+                 (bucket INTEGER NOT NULL, listing_id INTEGER NOT NULL,
+                  PRIMARY KEY (bucket, listing_id)) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS lsh_buckets_listing ON lsh_buckets (listing_id)')
+
+def reset_stale(c):
+    # Clear clusters, signatures and buckets built by an older SCHEME;
+    # returns True when it did
+    found = c.execute("SELECT version FROM table_versions WHERE name = 'dedup_scheme'").fetchone()
+    if found and found[0] >= SCHEME:
+        return False
+    c.execute("UPDATE listings SET cluster_id = NULL, minhash = NULL WHERE cluster_id IS NOT NULL")
+    c.execute("DELETE FROM lsh_buckets")
+    c.execute("INSERT OR REPLACE INTO table_versions (name, version) VALUES ('dedup_scheme', ?)", (SCHEME,))
+    return True
+
+def normalise(text):
+    text = unicodedata.normalize('NFKD', str(text or '')).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', ' ', text.lower()).split()
+
+def shingles(row):
+    # Brand and year are matched exactly through the band keys (see
+    # buckets), and price is left out because reposts usually change it.
+    # Fuel and gearbox, owner and address are one shingle each so that a
+    # dealer's name and street do not outweigh the vehicle itself.
+    out = {f"drive:{' '.join(normalise(row.get('fuel_type')))}|{' '.join(normalise(row.get('gearbox')))}",
+           f"owner:{' '.join(normalise(row.get('owner')))}",
+           f"adress:{' '.join(normalise(row.get('adress')))}"}
+    model = normalise(row.get('model'))
+    out.update(f"model:{tok}" for tok in model)
+    joined = "".join(model)
+    out.update(f"m3:{joined[i:i + 3]}" for i in range(len(joined) - 2))
+    km = kilometers(row)
+    if km is not None:
+        out.add(f"km:{km // KM_BUCKET}")
+    return out
+
+def kilometers(row):
+    km = re.sub(r'\D', '', str(row.get('kilometer') or ''))
+    return int(km) if km else None
+
+def same_vehicle(row, other):
+    # Similar listings can still be two vehicles: a repost comes from the
+    # same seller (addresses are only neighbourhoods), the mileage must
+    # agree within KM_TOLERANCE (or one KM_BUCKET), and fuel and gearbox
+    # must match where both listings state them
+    if normalise(row.get('owner')) != normalise(other.get('owner')):
+        return False
+    km, other_km = kilometers(row), kilometers(other)
+    if km is not None and other_km is not None and abs(km - other_km) > max(KM_BUCKET, KM_TOLERANCE * max(km, other_km)):
+        return False
+    for col in ('fuel_type', 'gearbox'):
+        value, other_value = normalise(row.get(col)), normalise(other.get(col))
+        if value and other_value and value != other_value:
+            return False
+    return True
+
+def _match(row, sig, member):
+    # Estimated similarity to a stored member (a MEMBER_COLUMNS row), or
+    # None when they cannot be the same vehicle
+    minhash, *values = member
+    if minhash is None or not same_vehicle(row, dict(zip(MEMBER_COLUMNS[1:], values))):
+        return None
+    similarity = float(np.mean(np.frombuffer(minhash, dtype=np.uint32) == sig))
+    return similarity if similarity >= SIMILARITY else None
+
+def _hash64(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+def _mix(z):
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def signature(row):
+    x = np.array([_hash64(s) for s in shingles(row)], dtype=np.int64).view(np.uint64)
+    return (_mix(x[:, None] ^ _SEEDS[None, :]).min(axis=0) >> np.uint64(32)).astype(np.uint32)
+
+def buckets(category, row, sig):
+    # Brand and year are part of every band key, so only listings of the
+    # same make and year can ever be compared.
+    block = f"{category}|{' '.join(normalise(row.get('brand')))}|{str(row.get('year') or '').strip()}"
+    return [_hash64(f"{block}|{b}|{sig[b * ROWS:(b + 1) * ROWS].tobytes().hex()}") for b in range(BANDS)]
+
+def assign_clusters(c, category, listing_ids):
+    # Put each listing without a cluster into the cluster whose members it
+    # all matches (the closest one when several do), or a new one of its
+    # own. Existing clusters are never merged.
+    for listing_id in listing_ids:
+        found = c.execute("SELECT * FROM listings WHERE id = ? AND cluster_id IS NULL", (listing_id,))
+        names = [d[0] for d in found.description]
+        row = found.fetchone()
+        if row is None:
+            continue
+        row = dict(zip(names, row))
+
+        sig = signature(row)
+        keys = buckets(category, row, sig)
+        marks = ", ".join("?" * len(keys))
+        candidates = c.execute(f'''SELECT cluster_id, {', '.join(MEMBER_COLUMNS)} FROM listings WHERE id IN
+                                   (SELECT listing_id FROM lsh_buckets WHERE bucket IN ({marks}))''', keys).fetchall()
+
+        cluster_id, best = listing_id, None
+        for cluster in sorted({r[0] for r in candidates if r[0] is not None and _match(row, sig, r[1:]) is not None}):
+            members = c.execute(f"SELECT {', '.join(MEMBER_COLUMNS)} FROM listings WHERE cluster_id = ?",
+                                (cluster,)).fetchall()
+            scores = [_match(row, sig, member) for member in members]
+            if None not in scores and (best is None or min(scores) > best):
+                cluster_id, best = cluster, min(scores)
+
+        c.execute("UPDATE listings SET cluster_id = ?, minhash = ? WHERE id = ?", (cluster_id, sig.tobytes(), listing_id))
+        c.executemany("INSERT OR IGNORE INTO lsh_buckets (bucket, listing_id) VALUES (?, ?)",
+                      [(key, listing_id) for key in keys])
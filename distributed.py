@@ -0,0 +1,204 @@
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import pandas as pd
+import scoring
+from db import init_db, reader, write
+from scraper import URLS, MAX_BAD_PAGES, MAX_DROP_RATIO, CrawlStats, _start_crawl, _finish_crawl, load_crawl, crawl_page
+
+# Distributed crawls. The coordinator creates one checkpointed crawl per
+# category (see scraper.py) and splits its pages into ranges of
+# LEASE_PAGES, stored in crawl_leases next to the data. Workers, local
+# processes or other machines sharing the database file, claim one range
+# at a time for LEASE_SECONDS and renew the lease before every page; a
+# range whose lease ran out (dead or stuck worker) is claimed again by
+# the next worker and resumes at its first pending page. Pages are
+# checkpointed exactly as in a single-process crawl, and the per-crawl
+# fingerprint set drops listings another worker already stored, so
+# ranges crawled twice do not duplicate anything. Empty pages end the
+# catalogue (later ranges are skipped); the drop-ratio circuit breaker of
+# scraper.CrawlStats is applied per lease and aborts the whole crawl.
+#
+#   python distributed.py coordinate voitures motos location --pages 200 --workers 4
+#   python distributed.py work            # on another host, same database
+LEASE_PAGES = 5
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 3
+POLL_SECONDS = 1.0
+
+
+def _plan(c, category, num_pages, lease_pages):
+    crawl_id = _start_crawl(c, category, num_pages)
+    c.executemany("INSERT INTO crawl_leases (crawl_id, first_page, last_page) VALUES (?, ?, ?)",
+                  [(crawl_id, first, min(first + lease_pages - 1, num_pages))
+                   for first in range(1, num_pages + 1, lease_pages)])
+    return crawl_id
+
+def plan(category, num_pages, lease_pages=LEASE_PAGES):
+    # New crawl of pages 1..num_pages split into leasable ranges
+    return write(_plan, category, num_pages, lease_pages)
+
+def _scope(crawl_ids):
+    # SQL condition and args restricting leases to `crawl_ids`, or to all
+    # running crawls
+    if crawl_ids:
+        return f"crawl_id IN ({', '.join('?' * len(crawl_ids))})", list(crawl_ids)
+    return "crawl_id IN (SELECT id FROM crawls WHERE status = 'running')", []
+
+def _claim(c, worker, crawl_ids, lease_seconds):
+    # Oldest open or expired range, leased to `worker`
+    now = int(time.time())
+    scope, args = _scope(crawl_ids)
+    lease = c.execute(f'''SELECT crawl_id, first_page, last_page FROM crawl_leases
+                          WHERE {scope} AND (status = 'open' OR (status = 'leased' AND expires < ?))
+                          ORDER BY crawl_id, first_page LIMIT 1''', args + [now]).fetchone()
+    if lease:
+        c.execute('''UPDATE crawl_leases SET status = 'leased', worker = ?, expires = ?, attempts = attempts + 1
+                     WHERE crawl_id = ? AND first_page = ?''', (worker, now + lease_seconds, lease[0], lease[1]))
+    return lease
+
+def _renew(c, worker, crawl_id, first_page, lease_seconds):
+    # False when the lease expired and was taken over by another worker
+    return c.execute('''UPDATE crawl_leases SET expires = ?
+                        WHERE crawl_id = ? AND first_page = ? AND worker = ? AND status = 'leased' ''',
+                     (int(time.time()) + lease_seconds, crawl_id, first_page, worker)).rowcount == 1
+
+def _release(c, worker, crawl_id, first_page, status):
+    # Hand a range back ('done', or 'open' to retry after an error; 'failed'
+    # after MAX_ATTEMPTS) and finish the crawl once no range is left
+    if status == 'open':
+        attempts = c.execute("SELECT attempts FROM crawl_leases WHERE crawl_id = ? AND first_page = ?",
+                             (crawl_id, first_page)).fetchone()[0]
+        status = 'failed' if attempts >= MAX_ATTEMPTS else 'open'
+    c.execute('''UPDATE crawl_leases SET status = ?, expires = NULL
+                 WHERE crawl_id = ? AND first_page = ? AND worker = ?''', (status, crawl_id, first_page, worker))
+
+    left, failed = c.execute('''SELECT SUM(status IN ('open', 'leased')), SUM(status = 'failed')
+                                FROM crawl_leases WHERE crawl_id = ?''', (crawl_id,)).fetchone()
+    running = c.execute("SELECT 1 FROM crawls WHERE id = ? AND status = 'running'", (crawl_id,)).fetchone()
+    if not left and running:
+        _finish_crawl(c, crawl_id, 'aborted' if failed else 'done',
+                      f"{failed} page ranges failed after {MAX_ATTEMPTS} attempts" if failed else None)
+
+def _skip_after(c, crawl_id, page):
+    # The catalogue ended before `page`: ranges nobody started are dropped
+    c.execute('''UPDATE crawl_leases SET status = 'skipped'
+                 WHERE crawl_id = ? AND first_page > ? AND status = 'open' ''', (crawl_id, page))
+
+def _abort(c, crawl_id, note):
+    # Circuit breaker: no range of the crawl is handed out or renewed again
+    c.execute('''UPDATE crawl_leases SET status = 'aborted', expires = NULL
+                 WHERE crawl_id = ? AND status IN ('open', 'leased')''', (crawl_id,))
+    if c.execute("SELECT 1 FROM crawls WHERE id = ? AND status = 'running'", (crawl_id,)).fetchone():
+        _finish_crawl(c, crawl_id, 'aborted', note)
+
+def pending(crawl_ids=None):
+    # Ranges still open or leased
+    scope, args = _scope(crawl_ids)
+    with reader() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM crawl_leases WHERE {scope} AND status IN ('open', 'leased')",
+                            args).fetchone()[0]
+
+def work(worker=None, crawl_ids=None, lease_seconds=LEASE_SECONDS, log=print):
+    # Claim and crawl ranges until none is left; returns pages fetched
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    fetched = 0
+    while True:
+        lease = write(_claim, worker, crawl_ids, lease_seconds)
+        if lease is None:
+            if not pending(crawl_ids):
+                return fetched
+            time.sleep(POLL_SECONDS)
+            continue
+
+        crawl_id, first, last = lease
+        category, ts, _, todo = load_crawl(crawl_id)
+        log(f"{worker}: crawl {crawl_id} ({category}) pages {first}-{last}")
+        status, empty, stats = 'done', 0, CrawlStats(category, crawl_id)
+        try:
+            for page in [p for p in todo if first <= p <= last]:
+                if not write(_renew, worker, crawl_id, first, lease_seconds):
+                    log(f"{worker}: lost the lease on crawl {crawl_id} pages {first}-{last}")
+                    status = None
+                    break
+                _, cards, kept, drops = crawl_page(crawl_id, category, ts, page)
+                stats.record_page(page, cards, kept, drops)
+                fetched += 1
+                empty = empty + 1 if cards == 0 else 0
+                if empty >= MAX_BAD_PAGES:
+                    log(f"{worker}: crawl {crawl_id} ran out of listings at page {page}")
+                    write(_skip_after, crawl_id, page)
+                    break
+                if stats.should_abort():
+                    note = (f"stopped after page {page}: {MAX_BAD_PAGES} consecutive pages "
+                            f"with more than {MAX_DROP_RATIO:.0%} dropped cards")
+                    log(f"{worker}: crawl {crawl_id} {note}")
+                    write(_abort, crawl_id, note)
+                    status = None
+                    break
+        except Exception as e:
+            log(f"{worker}: crawl {crawl_id} pages {first}-{last} failed: {type(e).__name__}: {e}")
+            status = 'open'
+        if status:
+            write(_release, worker, crawl_id, first, status)
+
+def summary(crawl_ids):
+    # One row per crawl: status, pages, cards and listings stored
+    marks = ", ".join("?" * len(crawl_ids))
+    with reader() as conn:
+        return pd.read_sql_query(f'''SELECT c.id AS crawl_id, c.category, c.status, c.num_pages,
+                                            (SELECT COUNT(*) FROM crawl_pages p WHERE p.crawl_id = c.id AND p.status = 'done') AS pages_done,
+                                            (SELECT SUM(kept) FROM crawl_pages p WHERE p.crawl_id = c.id) AS kept,
+                                            (SELECT SUM(dropped) FROM crawl_pages p WHERE p.crawl_id = c.id) AS dropped,
+                                            (SELECT COUNT(*) FROM crawl_seen s WHERE s.crawl_id = c.id) AS listings,
+                                            (SELECT COUNT(DISTINCT worker) FROM crawl_leases l WHERE l.crawl_id = c.id) AS workers,
+                                            (SELECT SUM(attempts > 1) FROM crawl_leases l WHERE l.crawl_id = c.id) AS reclaimed
+                                     FROM crawls c WHERE c.id IN ({marks}) ORDER BY c.id''', conn, params=list(crawl_ids))
+
+def _spawn(crawl_ids, lease_seconds):
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), 'work',
+                             '--crawl', *map(str, crawl_ids), '--lease-seconds', str(lease_seconds)])
+
+def coordinate(categories, num_pages, workers=2, lease_pages=LEASE_PAGES, lease_seconds=LEASE_SECONDS, log=print):
+    # Plan one crawl per category, run `workers` local worker processes
+    # (replacing any that die) and wait until every range is finished.
+    # With workers=0 it only waits, for workers started elsewhere.
+    crawl_ids = [plan(category, num_pages, lease_pages) for category in categories]
+    log(f"planned crawls {', '.join(map(str, crawl_ids))}")
+    procs = [_spawn(crawl_ids, lease_seconds) for _ in range(workers)]
+    while pending(crawl_ids):
+        for i, proc in enumerate(procs):
+            if proc.poll() not in (None, 0):
+                log(f"worker {proc.pid} exited with {proc.returncode}, starting another")
+                procs[i] = _spawn(crawl_ids, lease_seconds)
+        time.sleep(POLL_SECONDS)
+    for proc in procs:
+        proc.wait()
+    for category in categories:
+        scoring.score(category)
+    return summary(crawl_ids)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Crawl with several workers sharing page-range leases")
+    commands = parser.add_subparsers(dest='command', required=True)
+    coord = commands.add_parser('coordinate', help="plan crawls and run local workers")
+    coord.add_argument('categories', nargs='+', choices=sorted(URLS))
+    coord.add_argument('--pages', type=int, required=True, help="pages per category")
+    coord.add_argument('--workers', type=int, default=2, help="local worker processes (0: only wait)")
+    coord.add_argument('--lease-pages', type=int, default=LEASE_PAGES)
+    coord.add_argument('--lease-seconds', type=int, default=LEASE_SECONDS)
+    worker = commands.add_parser('work', help="crawl leased ranges until none is left")
+    worker.add_argument('--crawl', type=int, nargs='*', help="only these crawls (default: all running)")
+    worker.add_argument('--lease-seconds', type=int, default=LEASE_SECONDS)
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == 'coordinate':
+        print(coordinate(args.categories, args.pages, args.workers, args.lease_pages, args.lease_seconds)
+              .to_string(index=False))
+    else:
+        print(f"{work(crawl_ids=args.crawl, lease_seconds=args.lease_seconds)} pages fetched")
@@ -0,0 +1,119 @@
+import threading
+import numpy as np
+import pandas as pd
+
+# Facet index over a loaded table. Each value of a VALUE_FACETS column gets
+# a packed bitmap (one bit per row) and each RANGE_FACETS column is kept
+# sorted with its row positions, so a range becomes two binary searches.
+# Filtering ANDs the bitmaps of the selected facets (values of one facet
+# are ORed) and counting is a popcount of a bitmap AND; the frame itself
+# is only touched once, to build the index.
+VALUE_FACETS = ('brand', 'fuel_type', 'gearbox')
+RANGE_FACETS = ('year', 'price')
+VIEW_CACHE = 6
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(bits):
+    return int(_POPCOUNT[bits].sum(dtype=np.int64))
+
+
+class FacetIndex:
+    def __init__(self, df):
+        self.n = len(df)
+        self.all = np.packbits(np.ones(self.n, dtype=bool))
+        self.values = {}
+        for col in VALUE_FACETS:
+            if col not in df.columns:
+                continue
+            codes, uniques = pd.factorize(df[col].astype('string').str.strip(), sort=True)
+            self.values[col] = {value: np.packbits(codes == i) for i, value in enumerate(uniques) if value}
+        self.ranges = {}
+        for col in RANGE_FACETS:
+            if col not in df.columns:
+                continue
+            values = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+            known = np.flatnonzero(~np.isnan(values))
+            order = known[np.argsort(values[known], kind='stable')]
+            self.ranges[col] = (values[order], order)
+
+    def bounds(self, col):
+        # (min, max) of a range facet, or None when it has no values
+        values, _ = self.ranges.get(col, ((), None))
+        return (values[0], values[-1]) if len(values) else None
+
+    def _bits(self, rows):
+        bits = np.zeros(self.n, dtype=bool)
+        bits[rows] = True
+        return np.packbits(bits)
+
+    def facet_mask(self, col, chosen):
+        # Bitmap of one facet's selection, or None when it does not filter
+        if col in self.values:
+            if not chosen:
+                return None
+            out = np.zeros_like(self.all)
+            for value in chosen:
+                if value in self.values[col]:
+                    out |= self.values[col][value]
+            return out
+        if col in self.ranges and chosen is not None:
+            values, order = self.ranges[col]
+            lo, hi = chosen
+            if len(values) and lo <= values[0] and hi >= values[-1]:
+                return None
+            start, stop = np.searchsorted(values, lo, 'left'), np.searchsorted(values, hi, 'right')
+            return self._bits(order[start:stop])
+        return None
+
+    def mask(self, selection, skip=None):
+        # AND of every selected facet except `skip`
+        out = self.all
+        for col, chosen in selection.items():
+            if col == skip:
+                continue
+            bits = self.facet_mask(col, chosen)
+            if bits is not None:
+                out = out & bits
+        return out
+
+    def counts(self, selection):
+        # Rows per facet value (and per selected range) given the other
+        # facets' selections, as {col: {value: count}}
+        out = {}
+        for col, bitmaps in self.values.items():
+            others = self.mask(selection, skip=col)
+            out[col] = {value: popcount(bits & others) for value, bits in bitmaps.items()}
+        for col in self.ranges:
+            others = self.mask(selection, skip=col)
+            bits = self.facet_mask(col, selection.get(col))
+            out[col] = {'selected': popcount(others if bits is None else bits & others)}
+        return out
+
+    def rows(self, selection):
+        # Positions of the rows matching the whole selection
+        return np.flatnonzero(np.unpackbits(self.mask(selection), count=self.n))
+
+
+_cache = {}
+_lock = threading.Lock()
+
+def view_for(key, load):
+    # (frame, FacetIndex) for `key`, a (table, version...) tuple: on a miss
+    # load() builds the frame and the index is built over that very frame,
+    # so index.rows() positions always refer to it. Both are reused until
+    # the key changes; older versions of the same table are dropped.
+    with _lock:
+        found = _cache.get(key)
+    if found is not None:
+        return found
+    df = load()
+    found = (df, FacetIndex(df))
+    with _lock:
+        for old in [k for k in _cache if k[0] == key[0]]:
+            del _cache[old]
+        _cache[key] = found
+        while len(_cache) > VIEW_CACHE:
+            _cache.pop(next(iter(_cache)))
+    return found
@@ -0,0 +1,69 @@
+import os
+import zlib
+import hashlib
+import pandas as pd
+from db import reader, to_ts
+
+# Raw HTML of every fetched page, so rows lost to a broken parser can be
+# re-extracted later without the network (see replay.py). Pages are
+# stored zlib-compressed under their SHA-256, so a page fetched twice
+# with the same bytes (empty pages, unchanged listings) is kept once;
+# page_fetches records which crawl fetched which hash, when and from where.
+HTML_PATH = os.environ.get('DAKA_AUTO_HTML', 'html')
+LEVEL = 6
+
+
+def blob_path(sha, root=None):
+    return os.path.join(root or HTML_PATH, sha[:2], sha + '.z')
+
+def put(content):
+    # Store page bytes if new; returns their hash
+    sha = hashlib.sha256(content).hexdigest()
+    path = blob_path(sha)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(zlib.compress(content, LEVEL))
+        os.replace(tmp, path)
+    return sha
+
+def get(sha, root=None):
+    with open(blob_path(sha, root), 'rb') as f:
+        return zlib.decompress(f.read())
+
+def record(c, crawl_id, category, page, url, status, sha, size, ts):
+    c.execute('''INSERT INTO page_fetches (crawl_id, category, page, url, status, sha256, size, ts)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', (crawl_id, category, page, url, status, sha, size, ts))
+
+def fetches(categories=None, start=None, end=None):
+    # Latest fetch of every archived crawl page whose crawl started between
+    # the `start` and `end` dates, oldest crawl first
+    where, args = [], []
+    if categories:
+        where.append(f"f.category IN ({', '.join('?' * len(categories))})")
+        args += list(categories)
+    if start:
+        where.append("c.ts >= ?")
+        args.append(to_ts(f"{start} 00:00:00"))
+    if end:
+        where.append("c.ts <= ?")
+        args.append(to_ts(f"{end} 23:59:59"))
+    with reader() as conn:
+        return pd.read_sql_query(f'''SELECT f.id, f.crawl_id, f.category, f.page, f.sha256,
+                                            c.ts AS crawl_ts, c.status, p.kept AS kept_before
+                                     FROM page_fetches f JOIN crawls c ON c.id = f.crawl_id
+                                     LEFT JOIN crawl_pages p ON p.crawl_id = f.crawl_id AND p.page = f.page
+                                     WHERE f.id IN (SELECT MAX(id) FROM page_fetches GROUP BY crawl_id, page)
+                                     {"AND " + " AND ".join(where) if where else ""}
+                                     ORDER BY c.ts, f.crawl_id, f.page''', conn, params=args)
+
+def stats():
+    # Pages fetched, distinct blobs, and their raw vs compressed size
+    with reader() as conn:
+        pages, blobs, raw = conn.execute('''SELECT COUNT(*), COUNT(DISTINCT sha256),
+                                                   (SELECT SUM(size) FROM (SELECT DISTINCT sha256, size FROM page_fetches))
+                                            FROM page_fetches''').fetchone()
+        shas = [r[0] for r in conn.execute("SELECT DISTINCT sha256 FROM page_fetches")]
+    stored = sum(os.path.getsize(blob_path(sha)) for sha in shas if os.path.exists(blob_path(sha)))
+    return {'pages': pages, 'blobs': blobs, 'raw_bytes': raw or 0, 'stored_bytes': stored}
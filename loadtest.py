@@ -0,0 +1,230 @@
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from db import reader, COLUMNS
+
+# Load test for the Streamlit app. Each session drives app.py headlessly
+# with streamlit's AppTest through the same clicks a user would make and
+# records, per step: server time for the rerun, the size of the elements
+# sent to the browser, the size of any generated download and how much the
+# resident set grew during the rerun. Sessions run as threads of one
+# process, as `streamlit run` serves them, so they share the writer
+# thread, the reader pool and the in-process caches the way concurrent
+# users do (and with several sessions a step's RSS growth includes what
+# the others allocated meanwhile).
+#
+#   DAKA_AUTO_DB=synth.db python synth.py --rows 100000
+#   DAKA_AUTO_DB=synth.db python loadtest.py --sessions 4 --out after.json --compare before.json
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+# (step, [(widget kind, label or index, value), ...]) applied in order; the
+# widgets must be on screen after the previous step
+SCENARIO = [
+    ('open', []),
+    ('dashboard', [('radio', 0, " Dashboard")]),
+    ('dashboard_switch', [('selectbox', "Select data to visualize:", "Motos")]),
+    ('view_data', [('radio', 0, " View Data")]),
+    ('search', [('text_input', " Search in data:", "toyota")]),
+    ('table_switch', [('text_input', " Search in data:", ""), ('selectbox', "Select data to view:", "Motos")]),
+    ('hide_reposts', [('checkbox', "One row per vehicle (hide reposts)", True)]),
+    ('home', [('checkbox', "One row per vehicle (hide reposts)", False), ('radio', 0, " Home")]),
+]
+
+
+def _widget(at, kind, key):
+    widgets = at.sidebar.radio if kind == 'radio' else getattr(at, kind)
+    if isinstance(key, int):
+        return widgets[key]
+    return next(w for w in widgets if w.label == key)
+
+def _payload(at):
+    # Serialized size of every element in the rendered tree
+    total, stack = 0, [at._tree]
+    while stack:
+        node = stack.pop()
+        proto = getattr(node, 'proto', None)
+        if proto is not None and hasattr(proto, 'ByteSize'):
+            total += proto.ByteSize()
+        stack.extend(getattr(node, 'children', {}).values())
+    return total
+
+def _rss_mb():
+    # Current resident set size (Linux); ru_maxrss would be the lifetime
+    # peak, which only ever goes up
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        return float('nan')
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _share_runtime():
+    # AppTest installs a fresh mock Runtime (with its own st.cache_data
+    # store) around every rerun, removes it afterwards and patches the
+    # appTest config flag for the duration, so reruns in several threads
+    # would tear down each other's state. Install one runtime and the flag
+    # for the whole process instead, like the single runtime of
+    # `streamlit run`, and give AppTest a subclass to set its own on.
+    from contextlib import nullcontext
+    from unittest.mock import MagicMock
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.components.v2.component_manager import BidiComponentManager
+    from streamlit.testing.v1 import app_test
+    from streamlit.testing.v1.util import build_mock_config_get_option
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    runtime.bidi_component_registry = BidiComponentManager()
+    runtime.bidi_component_registry.discover_and_register_components(start_file_watching=False)
+    Runtime._instance = runtime
+    app_test.Runtime = type('Runtime', (Runtime,), {})
+    config.get_option = build_mock_config_get_option({"global.appTest": True})
+    app_test.patch_config_options = lambda overrides: nullcontext()
+
+# Sizes of the files each session thread generated during its current step
+_downloads = threading.local()
+
+def _record_downloads():
+    # AppTest keeps generated files in a throwaway store; record their sizes
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    store = MemoryMediaFileStorage.load_and_get_id
+    def load_and_get_id(self, path_or_data, mimetype, kind, filename=None):
+        if isinstance(path_or_data, bytes) and hasattr(_downloads, 'sizes'):
+            _downloads.sizes.append(len(path_or_data))
+        return store(self, path_or_data, mimetype, kind, filename)
+    MemoryMediaFileStorage.load_and_get_id = load_and_get_id
+
+def session(index, repeat, timeout):
+    # One user going through the scenario `repeat` times; returns a list
+    # of per-step measurements.
+    from streamlit.testing.v1 import AppTest
+
+    downloads = _downloads.sizes = []
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    results = []
+    for rep in range(repeat):
+        for step, actions in SCENARIO:
+            if step == 'open' and rep:
+                continue
+            for kind, key, value in actions:
+                _widget(at, kind, key).set_value(value)
+            downloads.clear()
+            rss = _rss_mb()
+            started = time.perf_counter()
+            at.run()
+            elapsed = time.perf_counter() - started
+            results.append({'session': index, 'rep': rep, 'step': step, 'ms': elapsed * 1000,
+                            'payload': _payload(at), 'download': sum(downloads), 'rss_delta_mb': _rss_mb() - rss,
+                            'error': str(at.exception[0].message) if at.exception else None})
+    return results
+
+def summarize(results):
+    out = {}
+    for step, _ in SCENARIO:
+        rows = [r for r in results if r['step'] == step]
+        ms = np.array([r['ms'] for r in rows])
+        out[step] = {
+            'runs': len(rows),
+            'p50_ms': float(np.percentile(ms, 50)),
+            'p95_ms': float(np.percentile(ms, 95)),
+            'max_ms': float(ms.max()),
+            'payload_kb': float(np.median([r['payload'] for r in rows])) / 1024,
+            'download_kb': float(np.median([r['download'] for r in rows])) / 1024,
+            'rss_delta_mb': float(np.median([r['rss_delta_mb'] for r in rows])),
+            'errors': sum(r['error'] is not None for r in rows),
+        }
+    return out
+
+def _git_rev():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(APP)).stdout.strip() or None
+    except OSError:
+        return None
+
+def row_counts():
+    with reader() as conn:
+        return {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in COLUMNS}
+
+def unindexed_counts():
+    # Listings without a MinHash signature, i.e. bulk-loaded by synth.py
+    # without --ingest: the dedup and change-feed paths were not exercised
+    with reader() as conn:
+        return dict(conn.execute("SELECT category, COUNT(*) FROM listings WHERE minhash IS NULL GROUP BY category"))
+
+def run(sessions=1, repeat=3, timeout=300):
+    started = time.perf_counter()
+    _share_runtime()
+    _record_downloads()
+    with ThreadPoolExecutor(sessions) as pool:
+        runs = [pool.submit(session, i, repeat, timeout) for i in range(sessions)]
+        results = [r for run in runs for r in run.result()]
+    return {
+        'meta': {'rev': _git_rev(), 'rows': row_counts(), 'unindexed': unindexed_counts(),
+                 'sessions': sessions, 'repeat': repeat,
+                 'python': sys.version.split()[0], 'wall_s': time.perf_counter() - started,
+                 'peak_rss_mb': _peak_rss_mb(),
+                 'date': time.strftime('%Y-%m-%d %H:%M:%S')},
+        'steps': summarize(results),
+        'errors': sorted({r['error'] for r in results if r['error']}),
+    }
+
+def markdown(report, baseline=None):
+    meta = report['meta']
+    lines = [f"rev {meta['rev']} | rows {meta['rows']} | {meta['sessions']} session(s) x {meta['repeat']}"
+             + (f" | peak RSS {meta['peak_rss_mb']:.0f} MB" if meta.get('peak_rss_mb') else ""),
+             "",
+             *([f"not ingested (no MinHash/LSH or change feed): {meta['unindexed']}", ""] if meta.get('unindexed') else []),
+             "| step | p50 ms | p95 ms | payload KB | download KB | RSS Δ MB |" + (" Δ p50 | Δ payload |" if baseline else ""),
+             "|---|---:|---:|---:|---:|---:|" + ("---:|---:|" if baseline else "")]
+    for step, s in report['steps'].items():
+        line = (f"| {step} | {s['p50_ms']:.0f} | {s['p95_ms']:.0f} | {s['payload_kb']:,.0f} "
+                f"| {s['download_kb']:,.0f} | {s['rss_delta_mb']:+.1f} |")
+        old = (baseline or {}).get('steps', {}).get(step)
+        if old:
+            line += f" {_change(s['p50_ms'], old['p50_ms'])} | {_change(s['payload_kb'], old['payload_kb'])} |"
+        elif baseline:
+            line += " | |"
+        lines.append(line)
+    for error in report['errors']:
+        lines.append(f"\nerror: {error}")
+    return "\n".join(lines)
+
+def _change(new, old):
+    return f"{(new - old) / old:+.0%}" if old else "n/a"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Drive the Streamlit app with simulated sessions")
+    parser.add_argument('--sessions', type=int, default=1, help="concurrent sessions")
+    parser.add_argument('--repeat', type=int, default=3, help="scenario runs per session")
+    parser.add_argument('--timeout', type=int, default=300, help="seconds allowed per rerun")
+    parser.add_argument('--out', help="write the JSON report here")
+    parser.add_argument('--compare', help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    report = run(args.sessions, args.repeat, args.timeout)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print(markdown(report, baseline))
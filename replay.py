@@ -0,0 +1,121 @@
+import os
+import argparse
+import multiprocessing
+import pandas as pd
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import changes
+import scoring
+import html_archive
+from db import init_db, write, _clear, COLUMNS
+from scraper import parse_page, count_drops, _checkpoint_page
+
+# Offline re-extraction of archived pages with the current parsers. Pages
+# are parsed in parallel worker processes (each distinct page once), then
+# stored in crawl order through the same per-page checkpoint as a live
+# crawl:
+#
+#   backfill  adds what the original parse missed; rows a crawl already
+#             stored are skipped through its fingerprint set
+#   rebuild   clears the categories first and re-creates them from the
+#             archive alone (listings not in the archive are lost); it
+#             replays every archived crawl, so it takes no date range
+#   dry-run   parses only and compares the counts with what was recorded
+#
+#   python replay.py --category voitures --from 2024-05-01 --to 2024-05-31
+WINDOW = 1000
+BATCH = 20
+
+
+def _parse(item):
+    category, sha, root = item
+    rows, errors, cards = parse_page(category, html_archive.get(sha, root))
+    return rows, cards, count_drops(errors)
+
+def _reset(c, category, crawl_ids):
+    _clear(c, category)
+    c.executemany("DELETE FROM crawl_seen WHERE crawl_id = ?", [(crawl_id,) for crawl_id in crawl_ids])
+
+def _apply(c, pages, finished):
+    # pages: (crawl_id, category, crawl_ts, page, rows, cards, drops);
+    # `finished` crawls get their removals once their last page is in
+    stored = Counter()
+    for crawl_id, category, ts, page, rows, cards, drops in pages:
+        stored[crawl_id] += len(_checkpoint_page(c, crawl_id, category, ts, page, rows, cards, drops))
+    for crawl_id in finished:
+        changes.removals(c, crawl_id)
+    return stored
+
+def replay(categories=None, start=None, end=None, mode='backfill', workers=None, log=print):
+    # Returns one row per crawl with pages, cards, rows kept before and
+    # now, cards dropped now, and the listings stored by this run
+    if mode == 'rebuild' and (start or end):
+        # Clearing a category drops crawls outside the range too
+        raise ValueError("rebuild replays the whole archive and takes no date range")
+    found = html_archive.fetches(categories, start, end)
+    if not len(found):
+        return pd.DataFrame()
+    if mode == 'rebuild':
+        for category, crawls in found.groupby('category')['crawl_id']:
+            write(_reset, category, sorted(crawls.unique().tolist()))
+
+    last_page = found.groupby('crawl_id')['id'].max()
+    totals = {}
+    def flush(pages, finished):
+        if mode != 'dry-run' and pages:
+            for crawl_id, n in write(_apply, pages, finished).items():
+                totals[crawl_id]['stored'] += n
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers or os.cpu_count(), mp_context=context) as pool:
+        for start_row in range(0, len(found), WINDOW):
+            window = found.iloc[start_row:start_row + WINDOW]
+            todo = list(dict.fromkeys(zip(window['category'], window['sha256'])))
+            parsed = dict(zip(todo, pool.map(_parse, [(cat, sha, html_archive.HTML_PATH) for cat, sha in todo],
+                                             chunksize=8)))
+
+            pages, finished = [], []
+            for f in window.itertuples():
+                rows, cards, drops = parsed[(f.category, f.sha256)]
+                total = totals.setdefault(f.crawl_id, {'category': f.category, 'pages': 0, 'cards': 0,
+                                                       'kept_before': 0, 'kept': 0, 'dropped': 0, 'stored': 0})
+                total['pages'] += 1
+                total['cards'] += cards
+                total['kept_before'] += 0 if pd.isna(f.kept_before) else int(f.kept_before)
+                total['kept'] += len(rows)
+                total['dropped'] += sum(drops.values())
+                pages.append((f.crawl_id, f.category, f.crawl_ts, f.page, rows, cards, drops))
+                if mode == 'rebuild' and f.status == 'done' and f.id == last_page[f.crawl_id]:
+                    finished.append(f.crawl_id)
+                if len(pages) >= BATCH or finished:
+                    flush(pages, finished)
+                    pages, finished = [], []
+            flush(pages, finished)
+            log(f"{min(start_row + WINDOW, len(found))}/{len(found)} pages")
+
+    if mode != 'dry-run':
+        for category in found['category'].unique():
+            scoring.score(category)
+    report = pd.DataFrame.from_dict(totals, orient='index').rename_axis('crawl_id').reset_index()
+    if mode == 'dry-run':
+        report = report.drop(columns='stored')
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Re-extract archived pages with the current parsers")
+    parser.add_argument('--category', nargs='*', choices=sorted(COLUMNS))
+    parser.add_argument('--from', dest='start', help="first crawl date (YYYY-MM-DD)")
+    parser.add_argument('--to', dest='end', help="last crawl date (YYYY-MM-DD)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--rebuild', action='store_const', dest='mode', const='rebuild',
+                      help="clear the categories and rebuild them from the archive")
+    mode.add_argument('--dry-run', action='store_const', dest='mode', const='dry-run',
+                      help="parse only and report")
+    parser.add_argument('--workers', type=int, help="parser processes (default: one per core)")
+    args = parser.parse_args()
+    if args.mode == 'rebuild' and (args.start or args.end):
+        parser.error("--rebuild clears whole categories and cannot be combined with --from/--to")
+
+    init_db()
+    report = replay(args.category, args.start, args.end, args.mode or 'backfill', args.workers)
+    print(report.to_string(index=False) if len(report) else "no archived pages in range")
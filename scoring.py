@@ -0,0 +1,156 @@
+import json
+import time
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from db import init_db, reader, write, table_version, bump_version, COLUMNS
+
+# Deal scores. Per category, a ridge regression of log(price) on vehicle
+# age (and its square), log kilometers and one-hot brand/fuel/gearbox is
+# fitted with NumPy over all current listings. A listing's score is how
+# far below the model its price is, in robust standard deviations
+# (positive = cheaper than comparable listings), stored in listing_scores.
+#
+# Models are kept in price_models and cached in-process by table version.
+# After a crawl only listings that are new, repriced or scored by an older
+# model are scored; the model is refitted when the number of priced
+# listings moved by more than REFIT_GROWTH since the fit.
+LAMBDA = 1.0
+REFIT_GROWTH = 0.1
+MIN_ROWS = 30
+MAX_LEVELS = 30
+MIN_LEVEL_COUNT = 5
+LEVELS = ('brand', 'fuel_type', 'gearbox')
+
+_models = {}
+_scored = {}
+_lock = threading.Lock()
+
+
+def _text(series):
+    return series.astype('string').str.strip().fillna('').to_numpy(dtype=object)
+
+def _numeric(series):
+    digits = series.astype('string').str.replace(r'\D', '', regex=True).replace('', pd.NA)
+    return pd.to_numeric(digits).to_numpy(dtype=float, na_value=np.nan)
+
+def features(df, model):
+    # Design matrix of `df` for `model` (intercept first)
+    age = np.clip(model['ref_year'] - _numeric(df['year']), 0, 40)
+    age = np.where(np.isnan(age), model['median_age'], age)
+    cols = [np.ones(len(df)), age, age ** 2]
+    if model['median_km'] is not None:
+        km = np.log1p(_numeric(df['kilometer']))
+        cols.append(np.where(np.isnan(km), model['median_km'], km))
+    for col, levels in model['levels'].items():
+        values = _text(df[col])
+        cols.extend((values == level).astype(float) for level in levels)
+    return np.column_stack(cols)
+
+def fit(df, category):
+    # Ridge fit on rows with a positive price; returns the model as a dict
+    df = df[pd.to_numeric(df['price'], errors='coerce') > 0]
+    year = _numeric(df['year'])
+    ref_year = time.localtime().tm_year
+    km = np.log1p(_numeric(df['kilometer'])) if 'kilometer' in df.columns else None
+    model = {
+        'category': category, 'n': len(df), 'ref_year': ref_year,
+        'median_age': float(np.nanmedian(np.clip(ref_year - year, 0, 40))) if np.isfinite(year).any() else 0.0,
+        'median_km': float(np.nanmedian(km)) if km is not None and np.isfinite(km).any() else None,
+        'levels': {},
+    }
+    for col in LEVELS:
+        if col in df.columns:
+            counts = pd.Series(_text(df[col])).value_counts()
+            counts = counts[(counts.index != '') & (counts >= MIN_LEVEL_COUNT)]
+            model['levels'][col] = counts.index[:MAX_LEVELS].tolist()
+
+    X = features(df, model)
+    y = np.log(df['price'].to_numpy(dtype=float))
+    penalty = LAMBDA * np.eye(X.shape[1])
+    penalty[0, 0] = 0
+    coef = np.linalg.solve(X.T @ X + penalty, X.T @ y)
+    resid = y - X @ coef
+    model['coef'] = coef.tolist()
+    model['sigma'] = float(1.4826 * np.median(np.abs(resid - np.median(resid)))) or 1.0
+    return model
+
+def predict(model, df):
+    # (expected price, score) arrays for `df`
+    expected = features(df, model) @ np.asarray(model['coef'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = (expected - np.log(df['price'].to_numpy(dtype=float))) / model['sigma']
+    return np.exp(expected), score
+
+def _save_model(c, category, version, model):
+    c.execute('''INSERT OR REPLACE INTO price_models (category, version, n, fitted, model)
+                 VALUES (?, ?, ?, ?, ?)''', (category, version, model['n'], int(time.time()), json.dumps(model)))
+
+def _store(c, category, version, ids, prices, expected, score):
+    c.executemany('''INSERT OR REPLACE INTO listing_scores
+                     (listing_id, category, price, expected_price, score, model_version)
+                     VALUES (?, ?, ?, ?, ?, ?)''',
+                  [(i, category, p, None if not np.isfinite(e) else round(e), None if not np.isfinite(s) else s, version)
+                   for i, p, e, s in zip(ids, prices, expected.tolist(), score.tolist())])
+    # Frames holding scores are cached by this version (see app.load_view)
+    bump_version(c, f"{category}_scores")
+
+def load_model(category):
+    # Latest stored model as (version fitted at, model), or (None, None)
+    with reader() as conn:
+        row = conn.execute("SELECT version, model FROM price_models WHERE category = ?", (category,)).fetchone()
+    return (row[0], json.loads(row[1])) if row else (None, None)
+
+def score(category, refit=False):
+    # Score what changed since the last call; returns the rows scored
+    version = table_version(category)
+    with _lock:
+        if not refit and _scored.get(category) == version:
+            return 0
+        fitted, model = _models.get(category, (None, None))
+    if model is None:
+        fitted, model = load_model(category)
+
+    columns = ", ".join(['id'] + COLUMNS[category] + ['price'])
+    with reader() as conn:
+        priced = conn.execute(f"SELECT COUNT(*) FROM {category} WHERE price > 0").fetchone()[0]
+        grown = model is None or abs(priced - model['n']) > REFIT_GROWTH * model['n']
+        if refit or grown:
+            todo = pd.read_sql_query(f"SELECT {columns} FROM {category} WHERE price > 0", conn)
+        else:
+            todo = pd.read_sql_query(f'''SELECT {", ".join("v." + col for col in ['id'] + COLUMNS[category] + ['price'])}
+                                         FROM {category} v LEFT JOIN listing_scores s ON s.listing_id = v.id
+                                         WHERE v.price > 0 AND (s.listing_id IS NULL OR s.price != v.price
+                                                                OR s.model_version != ?)''', conn, params=(fitted,))
+
+    if refit or grown:
+        if len(todo) < MIN_ROWS:
+            return 0
+        model, fitted = fit(todo, category), version
+        write(_save_model, category, fitted, model)
+    if len(todo):
+        expected, scores = predict(model, todo)
+        write(_store, category, fitted, todo['id'].tolist(), todo['price'].tolist(), expected, scores)
+    with _lock:
+        _models[category] = (fitted, model)
+        _scored[category] = version
+    return len(todo)
+
+def load_scores(category):
+    with reader() as conn:
+        return pd.read_sql_query('''SELECT listing_id AS id, score AS deal_score, expected_price
+                                    FROM listing_scores WHERE category = ?''', conn, params=(category,))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fit price models and score listings")
+    parser.add_argument('--category', nargs='*', choices=sorted(COLUMNS))
+    parser.add_argument('--refit', action='store_true', help="refit and rescore everything")
+    args = parser.parse_args()
+
+    init_db()
+    for category in args.category or COLUMNS:
+        started = time.perf_counter()
+        n = score(category, args.refit)
+        print(f"{category}: {n} listings scored in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,369 @@
+import os
+import sys
+import json
+import time
+import argparse
+import pandas as pd
+from collections import Counter
+from datetime import datetime
+from requests import get
+from bs4 import BeautifulSoup as bs
+import changes
+import scoring
+import html_archive
+from db import init_db, ingest, fingerprint, reader, write
+
+# Listing pages per category; DAKA_AUTO_BASE_URL points crawls at a mirror
+# or a local stand-in server
+BASE_URL = os.environ.get('DAKA_AUTO_BASE_URL', 'https://dakar-auto.com').rstrip('/')
+URLS = {
+    'voitures': BASE_URL + '/senegal/voitures-4?&page={}',
+    'motos': BASE_URL + '/senegal/motos-and-scooters-3?&page={}',
+    'location': BASE_URL + '/senegal/location-de-voitures-19?&page={}',
+}
+
+CARD_CLASS = 'listings-cards__list-item mb-md-3 mb-3'
+
+# Circuit breaker: a page is "bad" when it has no cards at all or when more
+# than MAX_DROP_RATIO of its cards fail to parse (pages with fewer than
+# MIN_CARDS cards are only judged on emptiness). The crawl stops after
+# MAX_BAD_PAGES bad pages in a row. When those pages are empty and earlier
+# pages had cards, the catalogue simply ended and the crawl is complete.
+MAX_DROP_RATIO = 0.5
+MIN_CARDS = 5
+MAX_BAD_PAGES = 2
+
+# A running crawl without a checkpoint for this long is taken as interrupted
+STALE_SECONDS = 120
+
+
+class CardError(Exception):
+    def __init__(self, field, error):
+        super().__init__(f"{field}: {type(error).__name__}: {error}")
+        self.field = field
+        self.error = error
+
+
+class CrawlStats:
+    def __init__(self, category, crawl_id=None):
+        self.category = category
+        self.crawl_id = crawl_id
+        self.pages = []
+        self.drops = Counter()
+        self.aborted = None
+        self.ended = None
+
+    def record_page(self, page, cards, kept, page_drops):
+        self.drops.update(page_drops)
+        self.pages.append({
+            'page': page, 'cards': cards, 'kept': kept, 'dropped': sum(page_drops.values()),
+            'drops': dict(page_drops),
+        })
+
+    @property
+    def requests(self):
+        return len(self.pages)
+
+    @property
+    def kept(self):
+        return sum(p['kept'] for p in self.pages)
+
+    @property
+    def dropped(self):
+        return sum(p['dropped'] for p in self.pages)
+
+    @property
+    def drop_ratio(self):
+        cards = self.kept + self.dropped
+        return self.dropped / cards if cards else 0.0
+
+    @property
+    def yield_per_request(self):
+        return self.kept / self.requests if self.requests else 0.0
+
+    def is_bad_page(self, page_stats):
+        if page_stats['cards'] == 0:
+            return True
+        if page_stats['cards'] < MIN_CARDS:
+            return False
+        return page_stats['dropped'] / page_stats['cards'] > MAX_DROP_RATIO
+
+    def should_abort(self):
+        recent = self.pages[-MAX_BAD_PAGES:]
+        return len(recent) == MAX_BAD_PAGES and all(self.is_bad_page(p) for p in recent)
+
+    def ran_out(self):
+        # Last page with cards when the catalogue ended, else None
+        recent = self.pages[-MAX_BAD_PAGES:]
+        if len(recent) < MAX_BAD_PAGES or any(p['cards'] for p in recent):
+            return None
+        return max((p['page'] for p in self.pages if p['cards']), default=None)
+
+    def drops_frame(self):
+        rows = [{'field': f, 'error': e, 'count': n} for (f, e), n in self.drops.most_common()]
+        return pd.DataFrame(rows, columns=['field', 'error', 'count'])
+
+    def pages_frame(self):
+        df = pd.DataFrame(self.pages, columns=['page', 'cards', 'kept', 'dropped', 'drops'])
+        df['drops'] = df['drops'].map(lambda d: ", ".join(f"{f}/{e}: {n}" for (f, e), n in d.items()))
+        return df
+
+
+# Card parsers: each returns a row dict or raises CardError naming the field
+# that could not be extracted.
+def _title(container):
+    return container.find('h2', class_='listing-card__header__title mb-md-2 mb-0').a.text.strip().split()
+
+def _adress(container):
+    return container.find('div', class_='col-12 entry-zone-address').text
+
+def _owner(container):
+    return "".join(container.find('p', class_='time-author m-0').a.text).replace('Par','')
+
+def _price(container):
+    return "".join(container.find('h3','listing-card__header__price font-weight-bold text-uppercase mb-0').text.strip().split()).replace('FCFA','')
+
+def parse_voiture(container):
+    field = 'title'
+    try:
+        gen_inf = _title(container)
+        brand = gen_inf[0]
+        model = " ".join(gen_inf[1:len(gen_inf)-1])
+        year = gen_inf[-1]
+
+        field = 'attributes'
+        gen_inf1 = container.find('ul', 'listing-card__attribute-list list-inline mb-0')
+        gen_inf2 = gen_inf1.find_all('li', 'listing-card__attribute list-inline-item')
+        kms_driven = gen_inf2[1].text.replace('km','')
+        gearbox = gen_inf2[2].text
+        fuel_type = gen_inf2[3].text
+
+        field = 'adress'
+        adress = _adress(container)
+        field = 'owner'
+        owner = _owner(container)
+        field = 'price'
+        price = _price(container)
+    except Exception as e:
+        raise CardError(field, e) from e
+
+    return {
+        "brand": brand, "model": model, "year": year,
+        "kilometer": kms_driven, "fuel_type": fuel_type,
+        "gearbox": gearbox, "adress": adress,
+        "owner": owner, "price": price
+    }
+
+def parse_moto(container):
+    field = 'title'
+    try:
+        gen_inf = _title(container)
+        brand = gen_inf[0]
+        year = gen_inf[-1]
+
+        field = 'attributes'
+        kms_driven = None
+        gen_inf1 = container.find('ul', class_='listing-card__attribute-list list-inline mb-0')
+        if gen_inf1:
+            gen_inf2 = gen_inf1.find_all('li', class_='listing-card__attribute list-inline-item')
+            if len(gen_inf2) > 1:
+                kms_driven = gen_inf2[1].text.replace('km', '')
+        if not kms_driven:
+            kms_driven = "0"
+
+        field = 'adress'
+        adress = _adress(container)
+        field = 'owner'
+        owner = _owner(container)
+        field = 'price'
+        price = _price(container)
+    except Exception as e:
+        raise CardError(field, e) from e
+
+    return {
+        "brand": brand, "year": year, "kilometer": kms_driven,
+        "adress": adress, "owner": owner, "price": price
+    }
+
+def parse_location(container):
+    field = 'title'
+    try:
+        gen_inf = _title(container)
+        brand = gen_inf[0]
+        year = gen_inf[-1]
+
+        field = 'owner'
+        owner = _owner(container)
+        field = 'adress'
+        adress = _adress(container)
+        field = 'price'
+        price = _price(container)
+    except Exception as e:
+        raise CardError(field, e) from e
+
+    return {
+        "brand": brand, "year": year, "adress": adress,
+        "owner": owner, "price": price
+    }
+
+PARSERS = {'voitures': parse_voiture, 'motos': parse_moto, 'location': parse_location}
+
+
+def parse_page(category, content):
+    # Returns (rows, errors, card count) for one listing page
+    soup = bs(content, 'html.parser')
+    containers = soup.find_all('div', class_=CARD_CLASS)
+    parser = PARSERS[category]
+
+    rows, errors = [], []
+    for container in containers:
+        try:
+            rows.append(parser(container))
+        except CardError as e:
+            errors.append(e)
+    return rows, errors, len(containers)
+
+def count_drops(errors):
+    return Counter((e.field, type(e.error).__name__) for e in errors)
+
+def _encode_drops(drops):
+    return json.dumps({f"{field}|{error}": n for (field, error), n in drops.items()})
+
+def _decode_drops(text):
+    return Counter({tuple(key.split('|', 1)): n for key, n in json.loads(text or '{}').items()})
+
+
+# Checkpointed crawls. A crawl is a crawls row plus one crawl_pages row per
+# page; each page's rows, fingerprints and "done" mark are committed in one
+# transaction, so a crawl killed at any point resumes at its first pending
+# page without refetching or duplicating anything.
+def _start_crawl(c, category, num_pages):
+    now = int(time.time())
+    c.execute('''INSERT INTO crawls (category, num_pages, ts, status, cursor, updated)
+                 VALUES (?, ?, ?, 'running', 1, ?)''', (category, num_pages, now, now))
+    crawl_id = c.lastrowid
+    c.executemany("INSERT INTO crawl_pages (crawl_id, page) VALUES (?, ?)",
+                  [(crawl_id, page) for page in range(1, num_pages + 1)])
+    return crawl_id
+
+def start_crawl(category, num_pages):
+    return write(_start_crawl, category, num_pages)
+
+def find_resumable(category):
+    # Latest interrupted crawl of a category, or None. Distributed crawls
+    # (with crawl_leases rows) belong to their workers, and a crawl that
+    # checkpointed a page within STALE_SECONDS may still be running in
+    # another session or process.
+    with reader() as conn:
+        row = conn.execute('''SELECT id, num_pages, cursor,
+                                     (SELECT COUNT(*) FROM crawl_pages p WHERE p.crawl_id = crawls.id AND p.status = 'done')
+                              FROM crawls WHERE category = ? AND status = 'running' AND COALESCE(updated, ts) < ?
+                                   AND NOT EXISTS (SELECT 1 FROM crawl_leases l WHERE l.crawl_id = crawls.id)
+                              ORDER BY id DESC LIMIT 1''', (category, int(time.time()) - STALE_SECONDS)).fetchone()
+    if row is None:
+        return None
+    return {'id': row[0], 'num_pages': row[1], 'cursor': row[2], 'done': row[3]}
+
+def load_crawl(crawl_id):
+    # Returns (category, ts, stats of the done pages, pending pages)
+    with reader() as conn:
+        category, ts = conn.execute("SELECT category, ts FROM crawls WHERE id = ?", (crawl_id,)).fetchone()
+        done = conn.execute('''SELECT page, cards, kept, drops FROM crawl_pages
+                               WHERE crawl_id = ? AND status = 'done' ORDER BY page''', (crawl_id,)).fetchall()
+        pending = [r[0] for r in conn.execute('''SELECT page FROM crawl_pages
+                                                 WHERE crawl_id = ? AND status = 'pending' ORDER BY page''',
+                                              (crawl_id,))]
+    stats = CrawlStats(category, crawl_id)
+    for page, cards, kept, drops in done:
+        stats.record_page(page, cards, kept, _decode_drops(drops))
+    return category, ts, stats, pending
+
+def _checkpoint_page(c, crawl_id, category, ts, page, rows, cards, drops, fetch=None):
+    if fetch:
+        html_archive.record(c, crawl_id, category, page, *fetch)
+    fresh = [row for row in rows
+             if c.execute("INSERT OR IGNORE INTO crawl_seen (crawl_id, fingerprint) VALUES (?, ?)",
+                          (crawl_id, fingerprint(category, row))).rowcount]
+    ingest(c, category, fresh, ts, crawl_id)
+    c.execute('''UPDATE crawl_pages SET status = 'done', cards = ?, kept = ?, dropped = ?, drops = ?
+                 WHERE crawl_id = ? AND page = ?''',
+              (cards, len(rows), sum(drops.values()), _encode_drops(drops), crawl_id, page))
+    c.execute("UPDATE crawls SET cursor = ?, updated = ? WHERE id = ?", (page + 1, int(time.time()), crawl_id))
+    return fresh
+
+def crawl_page(crawl_id, category, ts, page):
+    # Fetch, parse and checkpoint one page; returns (new rows, cards, kept, drops)
+    url = URLS[category].format(page)
+    res = get(url)
+    fetch = (url, res.status_code, html_archive.put(res.content), len(res.content), int(time.time()))
+    rows, errors, cards = parse_page(category, res.content)
+    drops = count_drops(errors)
+    fresh = write(_checkpoint_page, crawl_id, category, ts, page, rows, cards, drops, fetch)
+    return fresh, cards, len(rows), drops
+
+def _finish_crawl(c, crawl_id, status, note):
+    c.execute("UPDATE crawls SET status = ?, note = ?, updated = ? WHERE id = ?",
+              (status, note, int(time.time()), crawl_id))
+    # Only a completed crawl can tell which listings left the market
+    if status == 'done':
+        changes.removals(c, crawl_id)
+
+def finish_crawl(crawl_id, status, note=None):
+    write(_finish_crawl, crawl_id, status, note)
+
+def scrape(category, num_pages, progress=None, crawl_id=None):
+    # Run a new crawl of pages 1..num_pages, or resume `crawl_id`. Rows are
+    # stored page by page; returns (rows stored by this call, stats). Stops
+    # early when the circuit breaker trips.
+    if crawl_id is None:
+        crawl_id = start_crawl(category, num_pages)
+    category, ts, stats, pending = load_crawl(crawl_id)
+    total = stats.requests + len(pending)
+
+    df = pd.DataFrame()
+    for index in pending:
+        if progress:
+            progress(index, total)
+
+        rows, cards, kept, drops = crawl_page(crawl_id, category, ts, index)
+        stats.record_page(index, cards, kept, drops)
+
+        DF = pd.DataFrame(rows)
+        df = pd.concat([df, DF], axis=0).reset_index(drop=True)
+
+        stats.ended = stats.ran_out()
+        if stats.ended:
+            break
+        if stats.should_abort():
+            stats.aborted = (f"stopped after page {index}: {MAX_BAD_PAGES} consecutive pages "
+                             f"empty or with more than {MAX_DROP_RATIO:.0%} dropped cards")
+            break
+
+    finish_crawl(crawl_id, 'aborted' if stats.aborted else 'done',
+                 stats.aborted or (f"ran out of listings after page {stats.ended}" if stats.ended else None))
+    scoring.score(category)
+    if len(df):
+        df['scraped_date'] = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+    return df, stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Crawl one Dakar-Auto category headless")
+    parser.add_argument('category', choices=sorted(URLS))
+    parser.add_argument('--pages', type=int, default=1)
+    parser.add_argument('--resume', action='store_true', help="continue the latest interrupted crawl if there is one")
+    args = parser.parse_args()
+
+    init_db()
+    resumable = find_resumable(args.category) if args.resume else None
+    if resumable:
+        print(f"resuming crawl {resumable['id']} at page {resumable['cursor']} "
+              f"({resumable['done']}/{resumable['num_pages']} pages done)")
+    df, stats = scrape(args.category, args.pages, lambda i, n: print(f"page {i}/{n}", file=sys.stderr),
+                       resumable['id'] if resumable else None)
+    print(f"{len(df)} rows stored, {stats.kept} kept / {stats.dropped} dropped cards "
+          f"over {stats.requests} pages ({stats.yield_per_request:.1f} per request)")
+    if stats.ended:
+        print(f"ran out of listings after page {stats.ended}")
+    if stats.aborted:
+        print(stats.aborted)
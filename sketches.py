@@ -0,0 +1,197 @@
+import numpy as np
+
+# Mergeable price quantile sketches (merging t-digest) per
+# category x brand x model x year, plus two roll-ups per listing:
+# (brand, model, any year) and (brand, any model, any year). A sketch holds
+# the latest price of each listing of its key, so its count is a number of
+# listings: ingest adds the price of a new listing and swaps the old price
+# of a repriced one for the new one, and rebuild reads the same latest
+# prices. They answer percentile and CDF queries without reading listings.
+COMPRESSION = 100
+ANY = '*'
+MIN_COUNT = 5
+
+# Bumped when what a sketch holds changes; init_db then rebuilds them
+SCHEME = 2
+
+
+class TDigest:
+    def __init__(self, compression=COMPRESSION, means=(), weights=(), lo=np.inf, hi=-np.inf):
+        self.compression = compression
+        self.means = np.asarray(means, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.lo, self.hi = lo, hi
+
+    @property
+    def count(self):
+        return self.weights.sum()
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if len(values):
+            self._absorb(values, np.ones(len(values)), values.min(), values.max())
+
+    def remove(self, values):
+        # Take one unit of weight per value from the nearest centroid that
+        # still has it: the reverse of update, within the sketch's accuracy
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if not len(values) or not len(self.means):
+            return
+        weights = self.weights.copy()
+        for value in values:
+            left = np.flatnonzero(weights >= 1)
+            if not len(left):
+                break
+            weights[left[np.argmin(np.abs(self.means[left] - value))]] -= 1
+        keep = weights > 0
+        self.means, self.weights = self.means[keep], weights[keep]
+        if not len(self.means):
+            self.lo, self.hi = np.inf, -np.inf
+            return
+        # The exact min/max are gone when they were removed
+        if values.min() <= self.lo:
+            self.lo = self.means[0]
+        if values.max() >= self.hi:
+            self.hi = self.means[-1]
+
+    def merge(self, other):
+        if len(other.means):
+            self._absorb(other.means, other.weights, other.lo, other.hi)
+
+    def _k(self, q):
+        return self.compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+
+    def _k_inv(self, k):
+        return (np.sin(k * 2 * np.pi / self.compression) + 1) / 2
+
+    def _absorb(self, means, weights, lo, hi):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        self.lo, self.hi = min(self.lo, lo), max(self.hi, hi)
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+
+        # One pass merging neighbours while the merged centroid stays within
+        # one unit of the k1 scale function.
+        out_m, out_w = [means[0]], [weights[0]]
+        done = 0.0
+        limit = total * self._k_inv(self._k(0.0) + 1)
+        for m, w in zip(means[1:], weights[1:]):
+            if done + out_w[-1] + w <= limit:
+                out_m[-1] = (out_m[-1] * out_w[-1] + m * w) / (out_w[-1] + w)
+                out_w[-1] += w
+            else:
+                done += out_w[-1]
+                limit = total * self._k_inv(min(self._k(done / total) + 1, self.compression / 4))
+                out_m.append(m)
+                out_w.append(w)
+        self.means, self.weights = np.array(out_m), np.array(out_w)
+
+    def _points(self):
+        # Centroid means at their cumulative-weight midpoints, pinned to the
+        # exact min/max at the ends.
+        total = self.count
+        mids = (np.cumsum(self.weights) - self.weights / 2) / total
+        return np.concatenate([[0.0], mids, [1.0]]), np.concatenate([[self.lo], self.means, [self.hi]])
+
+    def quantile(self, q):
+        if not len(self.means):
+            return None
+        qs, xs = self._points()
+        return float(np.interp(q, qs, xs))
+
+    def cdf(self, x):
+        # Fraction of values at or below x; x may be an array
+        if not len(self.means):
+            return None
+        qs, xs = self._points()
+        out = np.interp(x, xs, qs)
+        return float(out) if np.ndim(out) == 0 else out
+
+    def to_bytes(self):
+        head = [self.compression, self.lo, self.hi]
+        return np.concatenate([head, self.means, self.weights]).astype('<f8').tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob):
+        arr = np.frombuffer(blob, dtype='<f8')
+        n = (len(arr) - 3) // 2
+        return cls(arr[0], arr[3:3 + n], arr[3 + n:], arr[1], arr[2])
+
+
+def init(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS price_sketches
+                 (category TEXT NOT NULL, brand TEXT NOT NULL, model TEXT NOT NULL, year TEXT NOT NULL,
+                  n INTEGER NOT NULL, digest BLOB NOT NULL,
+                  PRIMARY KEY (category, brand, model, year)) WITHOUT ROWID''')
+
+def scheme_changed(c):
+    # True, once, when the stored sketches were built under an older SCHEME
+    found = c.execute("SELECT version FROM table_versions WHERE name = 'sketch_scheme'").fetchone()
+    if found and found[0] >= SCHEME:
+        return False
+    c.execute("INSERT OR REPLACE INTO table_versions (name, version) VALUES ('sketch_scheme', ?)", (SCHEME,))
+    return True
+
+def keys(category, row):
+    # Exact key first, then the roll-ups used when it has too few prices
+    brand = (row.get('brand') or '').strip()
+    model = (row.get('model') or '').strip()
+    year = str(row.get('year') or '').strip()
+    return [(category, brand, model, year), (category, brand, model, ANY), (category, brand, ANY, ANY)]
+
+def update(c, category, rows):
+    # Apply (row, old price, new price) triples to the sketches of their
+    # keys: the old price (None for a new listing) leaves, the new one enters
+    batches = {}
+    for row, old, new in rows:
+        if old == new:
+            continue
+        for key in keys(category, row):
+            added, removed = batches.setdefault(key, ([], []))
+            if new is not None:
+                added.append(new)
+            if old is not None:
+                removed.append(old)
+    _store(c, batches)
+
+def _store(c, batches):
+    # batches: {key: (prices to add, prices to remove)}
+    for key, (added, removed) in batches.items():
+        found = c.execute('''SELECT digest FROM price_sketches
+                             WHERE category = ? AND brand = ? AND model = ? AND year = ?''', key).fetchone()
+        digest = TDigest.from_bytes(found[0]) if found else TDigest()
+        digest.update(added)
+        digest.remove(removed)
+        if digest.count:
+            c.execute('''INSERT OR REPLACE INTO price_sketches (category, brand, model, year, n, digest)
+                         VALUES (?, ?, ?, ?, ?, ?)''', key + (int(digest.count), digest.to_bytes()))
+        elif found:
+            c.execute("DELETE FROM price_sketches WHERE category = ? AND brand = ? AND model = ? AND year = ?", key)
+
+def rebuild(c, category):
+    # Recreate a category's sketches from the latest price of each listing
+    c.execute("DELETE FROM price_sketches WHERE category = ?", (category,))
+    batches = {}
+    for brand, model, year, price in c.execute('''SELECT l.brand, l.model, l.year, o.price FROM listings l
+                                                  JOIN observations o ON o.listing_id = l.id AND o.ts = l.last_seen
+                                                  WHERE l.category = ? AND o.price IS NOT NULL''', (category,)).fetchall():
+        for key in keys(category, {'brand': brand, 'model': model, 'year': year}):
+            batches.setdefault(key, ([], []))[0].append(price)
+    _store(c, batches)
+
+def load(conn, category):
+    # All sketches of a category as {(brand, model, year): TDigest}
+    return {(b, m, y): TDigest.from_bytes(blob) for b, m, y, blob in conn.execute(
+        "SELECT brand, model, year, digest FROM price_sketches WHERE category = ?", (category,))}
+
+def lookup(digests, category, row):
+    # Most specific sketch of a row with at least MIN_COUNT prices, or None
+    for key in keys(category, row):
+        digest = digests.get(key[1:])
+        if digest is not None and digest.count >= MIN_COUNT:
+            return digest
+    return None
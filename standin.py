@@ -0,0 +1,89 @@
+import re
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Local stand-in for the Dakar-Auto listing pages, to run crawls without
+# the network. Pages 1..pages carry CARDS cards each in the markup the
+# parsers expect (the same page always has the same cards); later pages
+# are empty, like the end of the real catalogue. `broken` is the share of
+# cards served without a price, to trip the drop-ratio circuit breaker.
+#
+#   python standin.py --port 8600 --pages 30
+#   DAKA_AUTO_BASE_URL=http://127.0.0.1:8600 python scraper.py voitures --pages 40
+CARDS = 20
+BRANDS = {
+    'Toyota': ['Corolla', 'Yaris', 'RAV4', 'Hilux'], 'Hyundai': ['Tucson', 'Elantra', 'i10'],
+    'Peugeot': ['208', '308', '3008'], 'Renault': ['Clio', 'Duster'], 'Kia': ['Picanto', 'Sportage'],
+    'Mercedes': ['C200', 'E350'],
+}
+PLACES = ['Dakar, Plateau', 'Dakar, Almadies', 'Dakar, Ouakam', 'Pikine', 'Rufisque', 'Thiès']
+
+
+def card(rnd, broken=False):
+    brand = rnd.choice(list(BRANDS))
+    price = '' if broken else f'''<h3 class="listing-card__header__price font-weight-bold text-uppercase mb-0">
+        {rnd.randint(10, 300) * 100} 000 FCFA</h3>'''
+    return f'''<div class="listings-cards__list-item mb-md-3 mb-3">
+      <h2 class="listing-card__header__title mb-md-2 mb-0"><a href="#">{brand} {rnd.choice(BRANDS[brand])} {rnd.randint(2000, 2023)}</a></h2>
+      {price}
+      <ul class="listing-card__attribute-list list-inline mb-0">
+        <li class="listing-card__attribute list-inline-item">Ref {rnd.randint(1, 10 ** 6)}</li>
+        <li class="listing-card__attribute list-inline-item">{rnd.randint(1, 300) * 1000} km</li>
+        <li class="listing-card__attribute list-inline-item">{rnd.choice(['Automatique', 'Manuelle'])}</li>
+        <li class="listing-card__attribute list-inline-item">{rnd.choice(['Essence', 'Diesel'])}</li>
+      </ul>
+      <div class="col-12 entry-zone-address">{rnd.choice(PLACES)}</div>
+      <p class="time-author m-0"><a>Par Vendeur {rnd.randint(1, 500)}</a></p>
+    </div>'''
+
+def page(category, n, pages, broken=0.0):
+    # HTML of listing page n of a category
+    if not 1 <= n <= pages:
+        return '<html><body><p>Aucune annonce</p></body></html>'
+    rnd = random.Random(f"{category}|{n}")
+    return '<html><body>' + ''.join(card(rnd, rnd.random() < broken) for _ in range(CARDS)) + '</body></html>'
+
+
+class Handler(BaseHTTPRequestHandler):
+    pages, broken, delay = 30, 0.0, 0.0
+
+    def do_GET(self):
+        found = re.search(r'page=(\d+)', self.path)
+        category = next((c for c in ('motos', 'location') if c in self.path), 'voitures')
+        body = page(category, int(found.group(1)) if found else 1, self.pages, self.broken).encode('utf-8')
+        time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start(port=0, pages=30, broken=0.0, delay=0.0):
+    # Serve in a background thread; returns the server (its port is
+    # server.server_address[1])
+    handler = type('Handler', (Handler,), {'pages': pages, 'broken': broken, 'delay': delay})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve stand-in Dakar-Auto listing pages locally")
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--pages', type=int, default=30, help="pages with listings per category")
+    parser.add_argument('--broken', type=float, default=0.0, help="share of cards without a price")
+    parser.add_argument('--delay', type=float, default=0.0, help="seconds before each response")
+    args = parser.parse_args()
+
+    server = start(args.port, args.pages, args.broken, args.delay)
+    print(f"Serving {args.pages} pages per category on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,170 @@
+import time
+import argparse
+import numpy as np
+import db
+import sketches
+from db import init_db, reader, write, ingest, fingerprint, bump_version, ATTRIBUTES
+
+# Synthetic listings for load testing: realistic brand/model mixes, ages,
+# mileages, Senegalese locations and FCFA prices, observed over several
+# crawls with occasional repricing. By default rows are bulk-inserted
+# through the writer in chunks and each listing is its own repost cluster
+# (no MinHash, LSH buckets or change feed); with ingest=True (--ingest) each
+# crawl goes through db.ingest in page-like batches instead, which is much
+# slower but exercises the real dedup, sketch and change-feed paths.
+CHUNK = 50_000
+INGEST_BATCH = 500
+
+CAR_MODELS = {
+    'Toyota': (['Corolla', 'Yaris', 'RAV4', 'Land Cruiser', 'Hilux', 'Camry', 'Prado'], 16e6),
+    'Hyundai': (['Tucson', 'Santa Fe', 'Elantra', 'i10', 'Accent'], 12e6),
+    'Peugeot': (['208', '308', '3008', '508', 'Partner'], 11e6),
+    'Renault': (['Clio', 'Megane', 'Duster', 'Logan'], 9e6),
+    'Kia': (['Picanto', 'Rio', 'Sportage', 'Sorento'], 10e6),
+    'Mercedes': (['C200', 'E350', 'GLE', 'ML350'], 26e6),
+    'Nissan': (['Qashqai', 'X-Trail', 'Navara', 'Patrol'], 14e6),
+    'Ford': (['Focus', 'Ranger', 'Escape'], 11e6),
+    'Honda': (['Civic', 'CR-V', 'Accord'], 12e6),
+    'Suzuki': (['Swift', 'Vitara', 'Alto'], 7e6),
+}
+CAR_WEIGHTS = [0.24, 0.14, 0.12, 0.09, 0.1, 0.08, 0.07, 0.06, 0.05, 0.05]
+MOTO_BRANDS = {'Yamaha': 2.5e6, 'Honda': 2.2e6, 'Suzuki': 2e6, 'TVS': 0.9e6, 'Jakarta': 0.6e6,
+               'KTM': 5e6, 'Kawasaki': 4.5e6, 'Piaggio': 2.8e6}
+ADRESSES = ['Dakar, Plateau', 'Dakar, Almadies', 'Dakar, Mermoz', 'Dakar, Ouakam', 'Dakar, Point E',
+            'Dakar, Parcelles Assainies', 'Dakar, Sacré-Coeur', 'Pikine', 'Guédiawaye', 'Rufisque',
+            'Thiès', 'Mbour', 'Saint-Louis', 'Touba', 'Kaolack', 'Ziguinchor']
+ADRESS_WEIGHTS = np.array([9, 8, 7, 6, 5, 6, 5, 8, 6, 5, 5, 4, 3, 3, 2, 2], dtype=float)
+DEALERS = ['Auto Plus', 'Dakar Motors', 'Sénégal Auto', 'Teranga Cars', 'CFAO Motors', 'Bamba Auto',
+           'Moto Center', 'Dakar Location', 'Rent Senegal']
+NAMES = ['Mamadou', 'Fatou', 'Ousmane', 'Aminata', 'Cheikh', 'Awa', 'Moussa', 'Mariama', 'Ibrahima',
+         'Khady', 'Abdoulaye', 'Ndeye', 'Modou', 'Astou', 'Pape', 'Aissatou']
+
+
+def _owners(rng, n):
+    dealer = rng.random(n) < 0.35
+    names = np.array(NAMES)[rng.integers(0, len(NAMES), n)].astype(object) + " " + rng.integers(1, 5000, n).astype(str)
+    return np.where(dealer, np.array(DEALERS)[rng.integers(0, len(DEALERS), n)], names)
+
+def generate(category, rng, n, this_year):
+    # Returns (columns dict of arrays, base price array)
+    age = np.minimum(rng.gamma(2.2, 3.5, n).astype(int), 30)
+    year = this_year - age
+    adress = np.array(ADRESSES)[rng.choice(len(ADRESSES), n, p=ADRESS_WEIGHTS / ADRESS_WEIGHTS.sum())]
+    cols = {'year': year.astype(str), 'adress': adress, 'owner': _owners(rng, n)}
+
+    if category == 'motos':
+        brands = np.array(list(MOTO_BRANDS))
+        b = rng.integers(0, len(brands), n)
+        base = np.array(list(MOTO_BRANDS.values()))[b]
+        km = (rng.gamma(2.0, 4000, n) * (age + 1) / 3).astype(int)
+        cols.update(brand=brands[b], kilometer=km.astype(str))
+        price = base * 0.9 ** age * np.exp(-km / 150_000)
+    else:
+        brands = np.array(list(CAR_MODELS))
+        b = rng.choice(len(brands), n, p=CAR_WEIGHTS)
+        base = np.array([CAR_MODELS[x][1] for x in brands])[b]
+        models = np.array([CAR_MODELS[brands[i]][0][j % len(CAR_MODELS[brands[i]][0])]
+                           for i, j in zip(b, rng.integers(0, 100, n))], dtype=object)
+        km = (rng.gamma(2.0, 9000, n) * (age + 1)).astype(int)
+        cols.update(brand=brands[b])
+        if category == 'voitures':
+            cols.update(model=models, kilometer=km.astype(str),
+                        fuel_type=np.where(rng.random(n) < 0.55, 'Essence', np.where(rng.random(n) < 0.9, 'Diesel', 'Hybride')),
+                        gearbox=np.where(rng.random(n) < 0.6, 'Automatique', 'Manuelle'))
+            price = base * 0.88 ** age * np.exp(-km / 400_000)
+        else:
+            # Rental: daily rate
+            price = base / 400 * 0.95 ** age
+
+    price = price * rng.lognormal(0, 0.25, n)
+    step = 5_000 if category == 'location' else 50_000
+    return cols, np.maximum(np.round(price / step) * step, step).astype(np.int64)
+
+def _bulk_insert(c, category, rows, fps, first, last, crawl_ts, prices):
+    # rows: attribute tuples; prices[k] is the price array for crawl k
+    base = c.execute("SELECT COALESCE(MAX(id), 0) FROM listings").fetchone()[0] + 1
+    ids = np.arange(base, base + len(rows))
+    c.executemany(f'''INSERT INTO listings (id, category, fingerprint, {", ".join(ATTRIBUTES)},
+                                            first_seen, last_seen, cluster_id)
+                      VALUES (?, ?, ?, {", ".join("?" * len(ATTRIBUTES))}, ?, ?, ?)''',
+                  [(int(i), category, fp, *r, crawl_ts[f], crawl_ts[l], int(i))
+                   for i, r, fp, f, l in zip(ids, rows, fps, first, last)])
+    for k, ts in enumerate(crawl_ts):
+        seen = (first <= k) & (k <= last)
+        c.executemany("INSERT INTO observations (listing_id, ts, price) VALUES (?, ?, ?)",
+                      zip(ids[seen].tolist(), [ts] * int(seen.sum()), prices[k][seen].tolist()))
+
+def _ingest_chunk(category, rows, first, last, crawl_ts, prices):
+    # Same listings and observations as _bulk_insert, one crawl at a time
+    for k, ts in enumerate(crawl_ts):
+        seen = np.flatnonzero((first <= k) & (k <= last))
+        for start in range(0, len(seen), INGEST_BATCH):
+            batch = [dict(zip(ATTRIBUTES, rows[i]), price=int(prices[k][i])) for i in seen[start:start + INGEST_BATCH]]
+            write(ingest, category, batch, ts)
+
+def _finish(c, category):
+    sketches.rebuild(c, category)
+    bump_version(c, category)
+
+def populate(category, rows, crawls=4, days=7, seed=0, ingest=False):
+    # Adds up to `rows` listings; duplicates of each other or of listings
+    # already stored (e.g. a second run with the same seed) are dropped
+    rng = np.random.default_rng([seed, list(db.COLUMNS).index(category)])
+    now = int(time.time())
+    crawl_ts = [now - (crawls - 1 - k) * days * 86400 for k in range(crawls)]
+    this_year = time.localtime(now).tm_year
+
+    with reader() as conn:
+        seen = {r[0] for r in conn.execute("SELECT fingerprint FROM listings")}
+    added = 0
+    for start in range(0, rows, CHUNK):
+        n = min(CHUNK, rows - start)
+        cols, price = generate(category, rng, n, this_year)
+        table = list(zip(*[cols.get(col, np.full(n, None, dtype=object)).tolist() for col in ATTRIBUTES]))
+
+        # Identical attributes mean the same listing; keep the first one
+        fps, keep = [], np.zeros(n, dtype=bool)
+        for i, row in enumerate(table):
+            fp = fingerprint(category, dict(zip(ATTRIBUTES, row)))
+            if fp not in seen:
+                seen.add(fp)
+                fps.append(fp)
+                keep[i] = True
+        table = [row for row, k in zip(table, keep) if k]
+        price, n = price[keep], len(table)
+
+        # Listings appear at a random crawl and stay for a random number of
+        # crawls; about one in ten changes price between crawls.
+        first = rng.integers(0, crawls, n)
+        last = np.minimum(first + rng.integers(0, crawls, n), crawls - 1)
+        prices = [price]
+        for _ in range(1, crawls):
+            cut = np.where(rng.random(n) < 0.1, rng.uniform(0.85, 1.0, n), 1.0)
+            prices.append((np.round(prices[-1] * cut / 5_000) * 5_000).astype(np.int64))
+        if ingest:
+            _ingest_chunk(category, table, first, last, crawl_ts, prices)
+        else:
+            write(_bulk_insert, category, table, fps, first, last, crawl_ts, prices)
+        added += n
+
+    if not ingest:
+        write(_finish, category)
+    return added
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fill the database with synthetic listings")
+    parser.add_argument('--rows', type=int, default=100_000, help="listings per category")
+    parser.add_argument('--category', choices=list(db.COLUMNS) + ['all'], default='all')
+    parser.add_argument('--crawls', type=int, default=4, help="number of observation snapshots")
+    parser.add_argument('--days', type=int, default=7, help="days between snapshots")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ingest', action='store_true',
+                        help="store through db.ingest (MinHash/LSH, sketches, change feed) instead of bulk inserts")
+    args = parser.parse_args()
+
+    init_db()
+    for category in db.COLUMNS if args.category == 'all' else [args.category]:
+        started = time.perf_counter()
+        added = populate(category, args.rows, args.crawls, args.days, args.seed, args.ingest)
+        print(f"{category}: {added} listings in {time.perf_counter() - started:.1f}s")